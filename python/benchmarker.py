@@ -48,7 +48,7 @@ from __future__ import with_statement
 __all__ = ('Benchmarker', 'Skip',)
 __version__ = '$Release: 0.0.0 $'.split()[1]
 
-import sys, os, re
+import sys, os, re, math
 from os import times as _os_times
 from time import time as _time_time
 
@@ -62,7 +62,11 @@ if python3:
 class Benchmarker(object):
 
     def __init__(self, loop=1, width=35, cycle=1, extra=0, filter=None,
-                 outfile=None, argv=None, reporter=None):
+                 outfile=None, argv=None, reporter=None, clock=None,
+                 isolate=None, jobs=None, compare=None, memory=False, gc=None,
+                 warmup=0, latency=False, overhead=True, jsonl=None, concurrency=1,
+                 counters=False, profile=0, flamegraph=0, history=None, html=None,
+                 paired=False, seed=None, rusage=False):
         self.loop    = loop
         self.width   = width
         self.cycle   = cycle
@@ -70,6 +74,25 @@ class Benchmarker(object):
         self.filter  = filter
         self.outfile = outfile
         self.argv    = argv
+        self.clock   = clock    # name of clock (ex: 'perf_counter_ns')
+        self.isolate = isolate  # None, 'process' or 'cycle'
+        self.jobs    = jobs     # number of worker processes to run benchmarks in parallel
+        self.compare = compare  # filename of baseline result (JSON file) to compare with
+        self.memory  = memory   # measure memory usage by tracemalloc if True
+        self.gc      = gc       # GC policy in timed region: 'enable', 'disable' or 'freeze'
+        self.warmup  = warmup   # max number of warmup runs before the first cycle
+        self.latency = latency  # sample latency of each iteration if True
+        self.overhead = overhead  # subtract loop overhead automatically if True
+        self.jsonl   = jsonl    # filename to append results in JSON Lines format
+        self.concurrency = concurrency  # number of concurrent tasks of async benchmark
+        self.counters = counters  # count perf events (Linux only) if True
+        self.profile = profile  # number of top functions to report by cProfile (0: off)
+        self.flamegraph = flamegraph  # sampling rate (Hz) of stack sampler (0: off)
+        self.history = history  # filename of SQLite database to append results
+        self.html    = html     # filename of HTML report
+        self.paired  = paired   # shuffle order of benchmarks in each cycle if True
+        self.seed    = seed     # seed of shuffle (random if None)
+        self.rusage  = rusage   # report resource usage (page faults, ...) if True
         self.benchmarks = []
         self.results = None
         self.reporter = reporter or Reporter(width)
@@ -91,6 +114,18 @@ class Benchmarker(object):
     def __call__(self, name, **tags):
         return self._new_benchmark(name, **tags)
 
+    def stmt(self, stmt, setup="pass", name=None, unroll=10, globals=None, **tags):
+        ## benchmark of statement (like timeit), compiled into function which
+        ## repeats statement 'unroll' times in each iteration of 'for' loop
+        ## (loop count means how many times statement is executed)
+        if not (isinstance(unroll, int) and unroll >= 1):
+            raise BenchmarkerError("unroll=%r: positive integer expected." % (unroll,))
+        bm = self._new_benchmark(stmt if name is None else name, **tags)
+        bm(_compile_stmt(stmt, setup, unroll, globals))
+        bm.stmt   = stmt
+        bm.unroll = unroll
+        return bm
+
     def _new_benchmark(self, name, **tags):
         bm = Benchmark(name, self.loop, **tags)
         self.benchmarks.append(bm)
@@ -105,7 +140,9 @@ class Benchmarker(object):
         def is_empty(bm):
             return bm.name is None
         def judge(bm, fn, key=key, expected=expected):
-            v = (bm.name   if key == 'name' else
+            v = ([bm.name, bm.group] if key == 'name' and bm.group else
+                 bm.name             if key == 'name' else
+                 str(bm.params[key]) if key in bm.params else
                  bm.tags.get(key))
             if isinstance(v, (list, tuple, set)):
                 return any( fn(expected, x) for x in v )
@@ -128,6 +165,28 @@ class Benchmarker(object):
         #    raise ValueError("-f %s: no benchmark matched" % filter_opt)
         return filtered
 
+    def _expand_params(self, benchmarks):
+        ## generate benchmark for each combination of parameters
+        ## (values can be overridden by command-line, ex: '--n=10,100')
+        import itertools
+        expanded = []
+        for bm in benchmarks:
+            if not bm.param_grid:
+                expanded.append(bm)
+                continue
+            grid = {}
+            for key, values in bm.param_grid.items():
+                if not isinstance(values, (list, tuple)):
+                    raise BenchmarkerError("%s: params[%r] should be a list of values." % (bm.name, key))
+                grid[key] = list(values)
+                val = self.properties.get(key)
+                if val is not None and val is not True:
+                    grid[key] = [ _parse_param_value(x) for x in str(val).split(',') ]
+            keys = sorted(grid)
+            for values in itertools.product(*[ grid[k] for k in keys ]):
+                expanded.append(bm._with_params(list(zip(keys, values))))
+        return expanded
+
     def _write(self, msg):
         sys.stdout.write(msg)
         sys.stdout.flush()
@@ -136,47 +195,162 @@ class Benchmarker(object):
         return (self.cycle or 1) + 2 * (self.extra or 0)
 
     def run(self):
-        self._setup()
-        self._run_body()
-        self._teardown()
+        self._stream = None
+        try:
+            self._setup()
+            self._run_body()
+            self._teardown()
+        finally:
+            if self._stream:
+                self._stream.close()
+            _close_event_loop()
 
     def _setup(self):
+        self._clock = _get_clock(self.clock).calibrate()
+        self._seed = None
+        if self.paired:
+            import random
+            self._seed = self.seed if self.seed is not None else random.randrange(1 << 16)
+        self.benchmarks = self._expand_params(self.benchmarks)
+        self._baseline = self._baseline_loops = None
+        if self.compare:
+            self._baseline = _load_result_file(self.compare)
+            self._baseline_loops = _load_result_loops(self.compare)
+        if self.memory and not hasattr(sys, 'getallocatedblocks'):
+            raise BenchmarkerError("memory=True: requires tracemalloc (Python 3.4 or later).")
+        if self.rusage and not _RusageProbe.available():
+            raise BenchmarkerError("rusage=True: requires resource module (Unix only).")
+        events = PerfCounters.available_events() if self.counters else None
+        ## loop overhead is subtracted automatically unless empty benchmark exists
+        has_empty = any( bm.name is None for bm in self.benchmarks )
+        for bm in self.benchmarks:
+            if bm.concurrency is None:
+                bm.concurrency = self.concurrency
+            if not (isinstance(bm.concurrency, int) and bm.concurrency >= 1):
+                raise BenchmarkerError("concurrency=%r: positive integer expected." % (bm.concurrency,))
+            bm.max_warmup = self.warmup or 0
+            bm.counters   = events
+            bm.rusage     = bool(self.rusage)
+            ## latency is sampled to report it under concurrency
+            bm.sampling   = bool(self.latency) or bm._tasks() > 1
+            bm.subtract_overhead = bool(self.overhead) and not has_empty
+            if bm.gc is None:
+                bm.gc = self.gc
+            if bm.gc is not None:
+                _GCProbe.validate(bm.gc)
+        if self.filter:
+            self.benchmarks = self._filter_benchmarks(self.benchmarks, self.filter)
+        for bm in self.benchmarks:
+            if bm.subtract_overhead and bm._loop:
+                ## measure in advance (shared with forked worker processes);
+                ## key should be the same as Benchmark._calc_elapsed() uses
+                LoopOverhead.get(bm._iterations(), bm._uses_with_block(),
+                                 self._clock, bm._tasks(), bm.sampling)
+        self._cpus = None
+        if self.jobs:
+            self._cpus = _select_cpus(self.jobs)
+            for i, bm in enumerate(self.benchmarks):
+                bm.cpu = self._cpus[i % self.jobs]
         rep = self.reporter
         self._write(rep.report_begin())
         self._write(rep.report_environment(self))
+        if self.jsonl:
+            self._stream = JsonLinesWriter(self.jsonl)
+            self._stream.write_begin(rep.json_data.get("Environment"))
 
     def _run_body(self):
-        ntimes = self._ntimes()
         write = self._write
         rep = self.reporter
         benchmarks = self.benchmarks
-        if self.filter:
-            benchmarks = self._filter_benchmarks(benchmarks, self.filter)
-            self.benchmarks = benchmarks
+        for bm in benchmarks:
+            bm.clock = self._clock
+        runner = self._new_runner(benchmarks)
+        try:
+            self._run_cycles(benchmarks, runner)
+        finally:
+            runner.close()
+        if self.extra:
+            for benchmark in self.benchmarks:
+                benchmark._exclude_min_max(self.extra)
+        self._run_extras(benchmarks)
+        write(rep.report_bench_end())
+
+    def _run_extras(self, benchmarks):
+        ## extra runs which are not timed (affect timing too much)
+        for bm in benchmarks:
+            if bm.skipped or bm.name is None:
+                continue
+            if self.memory:
+                bm._measure_memory()
+            if self.profile:
+                bm._profile(_output_path(self.outfile, bm.name, ".pstats"), self.profile)
+            if self.flamegraph:
+                bm._sample_stacks(_output_path(self.outfile, bm.name, ""), self.flamegraph)
+
+    def _new_runner(self, benchmarks):
+        if self.jobs:
+            return _ParallelRunner(benchmarks, self.jobs, self._cpus)
+        if not self.isolate:
+            return _InProcessRunner()
+        if self.isolate not in ('process', 'cycle'):
+            raise BenchmarkerError("isolate=%r: expected 'process' or 'cycle'." % (self.isolate,))
+        return _IsolatedRunner(benchmarks, self.isolate)
+
+    def _shuffle(self, benchmarks, rand):
+        ## shuffles benchmarks except empty benchmark (which should be the first)
+        if benchmarks and benchmarks[0].name is None:
+            head, rest = benchmarks[:1], benchmarks[1:]
+        else:
+            head, rest = [], benchmarks[:]
+        rand.shuffle(rest)
+        return head + rest
+
+    def _run_cycles(self, benchmarks, runner):
+        ntimes = self._ntimes()
+        write = self._write
+        rep = self.reporter
+        ## in paired mode, order is shuffled in each cycle so that slow drift
+        ## (ex: thermal throttling) doesn't affect specific benchmark
+        rand = None
+        if self.paired:
+            import random
+            rand = random.Random(self._seed)
         write(rep.report_bench_begin())
         for cycle in xrange(1, ntimes+1):
             write(rep.report_bench_header(None if ntimes == 1 else cycle))
             empty_bench_elapsed = None
-            for i, bm in enumerate(benchmarks):
+            pendings = []
+            ordered = self._shuffle(benchmarks, rand) if rand else benchmarks
+            for i, bm in enumerate(ordered):
                 is_empty_bench = bm.name is None
                 if is_empty_bench:
                     if i != 0:
                         raise BenchmarkerError("Empty benchmark should be the first of all.")
-                write(rep.report_bench_name(bm.name or "(Empty)"))
-                elapsed, skipped = bm.run(empty_bench_elapsed)
-                if skipped:
-                    if is_empty_bench:
+                    ## finish empty benchmark before others start
+                    write(rep.report_bench_name("(Empty)"))
+                    elapsed, skipped = runner.start(bm, None)()
+                    if skipped:
                         raise BenchmarkerError("Empty benchmark should not be skipped.")
+                    if cycle == ntimes:
+                        runner.finish(bm)
+                    write(rep.report_bench_elapsed(elapsed))
+                    if self._stream:
+                        self._stream.write_cycle(cycle, bm, elapsed, skipped)
+                    empty_bench_elapsed = elapsed
+                else:
+                    pendings.append((bm, runner.start(bm, empty_bench_elapsed)))
+            for bm, get_result in pendings:
+                write(rep.report_bench_name(bm.name))
+                elapsed, skipped = get_result()
+                if cycle == ntimes:
+                    runner.finish(bm)
+                if skipped:
                     write(rep.report_bench_skipped(skipped))
                 else:
                     write(rep.report_bench_elapsed(elapsed))
-                if is_empty_bench and not skipped:
-                    empty_bench_elapsed = elapsed
+                if self._stream:
+                    self._stream.write_cycle(cycle, bm, elapsed, skipped)
             write(rep.report_bench_footer())
-        if self.extra:
-            for benchmark in self.benchmarks:
-                benchmark._exclude_min_max(self.extra)
-        write(rep.report_bench_end())
 
     def _teardown(self):
         benchmarks = [ bm for bm in self.benchmarks
@@ -184,15 +358,67 @@ class Benchmarker(object):
         rep = self.reporter
         write = self._write
         write(rep.report_results(benchmarks))
+        write(rep.report_resolution_warnings(benchmarks, self._clock))
+        if any( bm.subtract_overhead for bm in benchmarks ):
+            write(rep.report_overhead(benchmarks))
+        if self.warmup:
+            write(rep.report_warmup(benchmarks))
         if self.extra:
             write(rep.report_ignores(benchmarks))
         if self._ntimes() > 1:
             write(rep.report_averages(benchmarks, self.cycle, self.extra))
+            write(rep.report_statistics(benchmarks))
+        if any( bm.group for bm in benchmarks ):
+            write(rep.report_params(benchmarks))
+            write(rep.report_complexity(benchmarks, self.memory))
+        if any( bm.stmt is not None for bm in benchmarks ):
+            write(rep.report_statements(benchmarks))
+        if self.latency:
+            write(rep.report_latency(benchmarks))
+        if any( bm._tasks() > 1 for bm in benchmarks ):
+            write(rep.report_concurrency(benchmarks))
+        if self.memory:
+            write(rep.report_memory(benchmarks))
+        if self.profile:
+            write(rep.report_profile(benchmarks))
+        if self.flamegraph:
+            write(rep.report_flamegraph(benchmarks))
+        if any( bm.gc for bm in benchmarks ):
+            write(rep.report_gc(benchmarks))
+        if self.counters:
+            write(rep.report_counters(benchmarks))
+        if self.rusage:
+            write(rep.report_rusage(benchmarks))
+        if self.paired:
+            write(rep.report_paired(benchmarks, self._seed))
         write(rep.report_ranking(benchmarks))
         write(rep.report_matrix(benchmarks))
+        if self._baseline is not None:
+            write(rep.report_comparison(benchmarks, self._baseline, self.compare,
+                                        self._baseline_loops))
         write(rep.report_end())
+        if self._stream:
+            self._stream.write_summary(rep.json_data)
         if self.outfile:
             self._write_outfile(self.outfile, rep.json_data)
+        if self.history:
+            self._write_history(self.history, benchmarks, rep.json_data)
+        if self.html:
+            self._write_html(self.html, rep.json_data)
+
+    def _write_html(self, filename, json_data):
+        html = HtmlReporter(json_data).render()
+        with open(filename, 'w') as f:
+            f.write(html)
+
+    def _write_history(self, filename, benchmarks, json_data):
+        environment = dict(json_data.get("Environment") or {})
+        environment["git commit"] = _git_commit()
+        history = History(filename)
+        try:
+            history.record(environment, benchmarks)
+        finally:
+            history.close()
 
     def _write_outfile(self, outfile, json_data):
         import json
@@ -216,69 +442,403 @@ class DeprecatedUsageError(Exception):
 
 class Benchmark(object):
 
+    AUTO_LOOP_TIME = 0.2    # target time (sec) of a calibrated run
+    MAX_AUTO_LOOP  = 10**8  # calibration gives up when loop count exceeds this
+    NONSCALING_LOOP = 10**5 # calibration judges whether time grows with loop from this
+    WARMUP_WINDOW    = 3    # number of successive warmup runs to compare
+    WARMUP_TOLERANCE = 0.05 # regard as steady if they differ within this ratio
+    SAMPLING_OVERHEAD = 0.01    # max ratio of clock overhead in sampling chunk
+
     def __init__(self, name, loop, **tags):
         self.name        = name
-        self._loop       = loop
+        self._loop       = None if loop == 'auto' else loop
+        self.gc          = tags.pop('gc', None)   # GC policy ('enable', 'disable' or 'freeze')
+        self.concurrency = tags.pop('concurrency', None)  # number of concurrent tasks (async)
+        self.is_async    = False    # True if func is coroutine function ('async def')
+        self.param_grid  = tags.pop('params', None)   # ex: {"n": [10, 1000, 100000]}
+        self.params      = {}       # parameter values passed to func as keyword args
+        self.param_names = []       # sorted keys of params
+        self.group       = None     # original name of parametrized benchmark
         self.tags        = tags
         self.results     = []
         self.skipped     = None
+        self.clock       = None     # Clock object (default: _get_clock(None))
+        self.cpu         = None     # cpu id which runs this benchmark ('--jobs=N')
         self._extra_mins = []
         self._extra_maxs = []
         self._average    = None
+        self._stats      = None
         self._start_at   = self._end_at = None
         self._not_yet    = True
+        self._probes     = []       # objects which have start() and stop(), called
+                                    # at the beginning and end of timed region
+        self._probes_running = False
+        self._loop_end   = None     # called when 'for _ in bm' finished (extra run)
+        self.memory      = None     # MemoryUsage object ('--memory')
+        self.profile     = None     # Profile object ('--profile')
+        self.stack_sampler = None   # StackSampler object ('--flamegraph')
+        self.max_warmup  = 0        # max number of warmup runs ('--warmup=N')
+        self.warmup      = None     # Warmup object
+        self._warmed_up_pid = None  # id of process which has warmed up
+        self.sampling    = False    # sample latency of iterations ('--latency')
+        self.counters    = None     # names of perf events to count ('--counters')
+        self.rusage      = False    # record deltas of getrusage() ('--rusage')
+        self.subtract_overhead = False  # subtract LoopOverhead from results
+        self.overhead    = None     # LoopOverhead object subtracted from results
+        self._with_block = False    # True if 'with bm:' is used
+        self._latencies  = None     # list of (latency per iteration, iterations)
+        self.stmt        = None     # source code of statement ('bench.stmt()')
+        self.unroll      = 1        # number of statements in each iteration
 
     def __call__(self, func):   # decorator
         self.func = func
+        self.is_async = _is_coroutine_function(func)
         return self   # not func
 
+    def _with_params(self, pairs):
+        ## new benchmark which calls func with parameters (ex: [('n', 10)])
+        name = "%s(%s)" % (self.name, ", ".join( "%s=%s" % kv for kv in pairs ))
+        bm = Benchmark(name, 'auto' if self._loop is None else self._loop, **self.tags)
+        bm.func        = self.func
+        bm.is_async    = self.is_async
+        bm.gc          = self.gc
+        bm.concurrency = self.concurrency
+        bm.params      = dict(pairs)
+        bm.param_names = [ k for k, _ in pairs ]
+        bm.group       = self.name
+        return bm
+
+    def _call(self):
+        return self.func(self, **self.params)
+
+    _WITH_OPNAMES = ('SETUP_WITH', 'BEFORE_WITH', 'SETUP_ASYNC_WITH',
+                     'BEFORE_ASYNC_WITH', 'LOAD_SPECIAL')
+
+    def _uses_with_block(self):
+        ## whether func contains 'with bm:' (detected from bytecode before
+        ## running it); actual usage is known after the first run
+        code = getattr(self.func, '__code__', None)
+        try:
+            import dis
+            instructions = list(dis.get_instructions(code))
+        except (ImportError, AttributeError, TypeError):
+            return False
+        if not code.co_argcount:
+            return False
+        arg = code.co_varnames[0]
+        for i, inst in enumerate(instructions):
+            if inst.opname in self._WITH_OPNAMES:
+                for prev in instructions[max(i-3, 0):i]:
+                    if prev.opname.startswith('LOAD_FAST') and prev.argval == arg:
+                        return True
+        return False
+
+    def _tasks(self):
+        ## number of concurrent tasks, or 0 if not async
+        return (self.concurrency or 1) if self.is_async else 0
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def _iterations(self):
+        ## number of iterations of 'for _ in bm' (loop is divided by unroll)
+        return -(-self._loop // self.unroll)
+
+    def _now(self):
+        clock = self.clock or _get_clock(None)
+        return (_os_times(), clock.func())
+
     def __iter__(self):
         if self._not_yet:
             raise DeprecatedUsageError()
-        return iter(xrange(self._loop))
+        if self._latencies is not None:
+            return self._sampling_iter(self._latencies)
+        if self._loop_end is not None:
+            return self._hooked_iter(self._loop_end)
+        return iter(xrange(self._iterations()))
+
+    def _hooked_iter(self, callback):
+        ## calls callback before locals of benchmark function are released
+        for i in xrange(self._iterations()):
+            yield i
+        callback()
+
+    def _sampling_iter(self, latencies):
+        ## time chunk of iterations; chunk size is doubled until clock
+        ## overhead becomes less than SAMPLING_OVERHEAD of chunk time
+        clock = self.clock or _get_clock(None)
+        now = clock.func
+        min_time = (clock.overhead or 0.0) / self.SAMPLING_OVERHEAD
+        chunk = 1
+        i, loop = 0, self._iterations()
+        unroll = self.unroll
+        while i < loop:
+            n = min(chunk, loop - i)
+            t0 = now()
+            for j in xrange(i, i + n):
+                yield j
+            t1 = now()
+            t = clock.elapsed(t0, t1)
+            latencies.append((t / (n * unroll), n * unroll))
+            if t < min_time:
+                chunk *= 2
+            i += n
 
     def __enter__(self):
         if self._not_yet:
             raise DeprecatedUsageError()
-        self._start_at = (_os_times(), _time_time())
+        self._start_probes()
+        self._start_at = self._now()
         return self
 
     def __exit__(self, *args):
-        self._end_at = (_os_times(), _time_time())
+        self._end_at = self._now()
+        self._stop_probes()
         if self._not_yet:
             elapsed = self._calc_elapsed(self._start_at, self._end_at)
             self._start_at = self._end_at = None
             self.results.append(elapsed)
 
     def run(self, empty_bench_elapsed=None):
+        elapsed, skipped = self._run(empty_bench_elapsed)
+        self._add_result(elapsed, skipped)
+        return elapsed, skipped
+
+    def _run(self, empty_bench_elapsed):
         self._not_yet = False
-        self._start_at = self._end_at = None
         try:
-            start_at = (_os_times(), _time_time())
-            self.func(self)
-            end_at = (_os_times(), _time_time())
+            if self._loop is None:
+                self._loop = self._calibrate_loop()
+            if self.unroll > 1:
+                self._loop = self._iterations() * self.unroll
+            ## warm up once in each process ('--isolate=cycle' runs each
+            ## cycle in fresh worker process, which needs warmup again)
+            warmup = None
+            if self.max_warmup and self._warmed_up_pid != os.getpid():
+                warmup = self._warm_up(self.max_warmup)
+                self._warmed_up_pid = os.getpid()
+                if self.warmup is None:
+                    self.warmup = warmup
+            gc_probe = counters = rusage = None
+            latencies = self._latencies = [] if self.sampling else None
+            try:
+                gc_probe = _GCProbe(self.gc, self.clock) if self.gc else None
+                if gc_probe:
+                    self._probes.append(gc_probe)
+                counters = PerfCounters(self.counters).open() if self.counters else None
+                if counters:
+                    self._probes.append(counters)
+                ## started last (and stopped first) not to count cost of other probes
+                rusage = _RusageProbe() if self.rusage else None
+                if rusage:
+                    self._probes.append(rusage)
+                start_at, end_at = self._measure()
+            finally:
+                self._latencies = None
+                for probe in (rusage, gc_probe, counters):
+                    if probe:
+                        self._probes.remove(probe)
+                if counters:
+                    counters.close()
         except Skip:
-            skipped = sys.exc_info()[1]
+            return None, sys.exc_info()[1]
+        elapsed = self._calc_elapsed(start_at, end_at, empty_bench_elapsed)
+        if gc_probe:
+            elapsed.gc_collections = gc_probe.collections
+            elapsed.gc_pause       = gc_probe.pause
+        elapsed.warmup = warmup
+        if latencies and elapsed.overhead and elapsed.overhead.latency:
+            ## subtract cost of 'for _ in bm' (incl. sampling) from each sample
+            cost = elapsed.overhead.latency
+            latencies = [ (max(t - cost, 0.0), n) for t, n in latencies ]
+        elapsed.latencies = latencies
+        if counters:
+            elapsed.counters = counters.values
+        if rusage:
+            elapsed.rusage = rusage.values
+        return elapsed, None
+
+    def _add_result(self, elapsed, skipped):
+        if skipped:
             self.skipped = skipped
-            elapsed = None
         else:
-            skipped = None
-            if self._start_at and self._end_at:
-                start_at, end_at = self._start_at, self._end_at
-            elapsed = self._calc_elapsed(start_at, end_at, empty_bench_elapsed)
+            self._loop = elapsed.loop
+            if elapsed.overhead:
+                self.overhead = elapsed.overhead
+            if self.warmup is None:
+                self.warmup = elapsed.warmup   # warmed up in worker process
             self.results.append(elapsed)
+
+    def _measure(self):
+        if self.is_async:
+            return self._measure_async()
         self._start_at = self._end_at = None
-        return elapsed, skipped
+        try:
+            self._start_probes()
+            start_at = self._now()
+            self._call()
+            end_at = self._now()
+            self._with_block = bool(self._start_at and self._end_at)
+            if self._with_block:
+                start_at, end_at = self._start_at, self._end_at
+            else:
+                self._stop_probes()
+            return start_at, end_at
+        finally:
+            self._stop_probes()   # when func raised (ex: Skip)
+            self._start_at = self._end_at = None
+
+    def _measure_async(self):
+        ## event loop is created (and reused) out of timed region
+        import asyncio
+        loop = _event_loop()
+        tasks = self._tasks()
+        self._start_at = self._end_at = None
+        try:
+            self._start_probes()
+            start_at = self._now()
+            if tasks == 1:
+                loop.run_until_complete(self._call())
+            else:
+                futures = [ loop.create_task(self._call()) for _ in xrange(tasks) ]
+                loop.run_until_complete(asyncio.gather(*futures))
+            end_at = self._now()
+            self._with_block = bool(self._start_at and self._end_at)
+            if self._with_block:
+                if tasks > 1:
+                    raise BenchmarkerError("%s: 'with bm:' is not available with concurrency." % (self.name,))
+                start_at, end_at = self._start_at, self._end_at
+            else:
+                self._stop_probes()
+            return start_at, end_at
+        finally:
+            self._stop_probes()   # when func raised (ex: Skip)
+            self._start_at = self._end_at = None
+
+    def _start_probes(self):
+        self._probes_running = True
+        for probe in self._probes:
+            probe.start()
+
+    def _stop_probes(self):
+        if not self._probes_running:
+            return
+        self._probes_running = False
+        for probe in reversed(self._probes):
+            probe.stop()
+
+    def _run_extra(self, probe):
+        ## runs benchmark once more with probe, without recording result
+        self._probes.append(probe)
+        self._loop_end = getattr(probe, 'loop_end', None)
+        try:
+            self._measure()
+        except Skip:
+            pass
+        finally:
+            self._loop_end = None
+            self._probes.remove(probe)
+        return probe
+
+    def _measure_memory(self):
+        mem = self._run_extra(MemoryUsage(self._loop))
+        if mem.peak is not None:
+            mem._subtract(MemoryUsage.overhead())
+        self.memory = mem
+
+    def _profile(self, path, top):
+        prof = self._run_extra(Profile())
+        prof.dump(path)
+        prof.top = prof.top_functions(top)
+        self.profile = prof
+
+    def _sample_stacks(self, basepath, rate):
+        root = getattr(self.func, '__code__', None)
+        sampler = self._run_extra(StackSampler(rate, self.clock, root))
+        sampler.dump(basepath, self.name)
+        self.stack_sampler = sampler
+
+    def _warm_up(self, max_runs):
+        ## repeat runs (not recorded) until successive WARMUP_WINDOW runs
+        ## become steady, or until max_runs
+        clock = self.clock or _get_clock(None)
+        window = self.WARMUP_WINDOW
+        curve = []
+        while len(curve) < max_runs:
+            start_at, end_at = self._measure()
+            curve.append(clock.elapsed(start_at[1], end_at[1]))
+            recent = curve[-window:]
+            if len(recent) == window and min(recent) > 0:
+                if (max(recent) - min(recent)) / min(recent) <= self.WARMUP_TOLERANCE:
+                    return Warmup(curve, True)
+        return Warmup(curve, False)
+
+    def _calibrate_loop(self):
+        ## grow loop count (1, 2, 5, 10, 20, 50, ...) until a run takes
+        ## AUTO_LOOP_TIME or more, and also long enough compared to
+        ## resolution of clock.
+        ## time may not grow with loop count (ex: 'for _ in bm' is not used),
+        ## therefore gives up when time doesn't increase while loop count
+        ## grows 100 times (from NONSCALING_LOOP / 100, in order not to
+        ## confuse it with fixed cost such as setup in timed region),
+        ## or when loop count exceeds MAX_AUTO_LOOP.
+        clock = self.clock or _get_clock(None)
+        target = max(self.AUTO_LOOP_TIME,
+                     (clock.resolution or 0.0) * Clock.WARN_TICKS * 100)
+        def error(elapsed):
+            return BenchmarkerError("%s: time doesn't grow with loop count (loop=%s, %s);"
+                                    " use 'for _ in bm' or specify loop count instead of 'auto'."
+                                    % (self.name, self._loop, _format_duration(elapsed)))
+        elapseds = {}   # loop count to elapsed time
+        loop = 1
+        while True:
+            for n in (1, 2, 5):
+                self._loop = loop * n
+                start_at, end_at = self._measure()
+                elapsed = clock.elapsed(start_at[1], end_at[1])
+                if elapsed >= target:
+                    return self._loop
+                elapseds[self._loop] = elapsed
+                prev = elapseds.get(self._loop // 100)
+                if self._loop >= self.NONSCALING_LOOP and prev is not None and elapsed <= prev:
+                    raise error(elapsed)
+                if self._loop >= self.MAX_AUTO_LOOP:
+                    raise error(elapsed)
+            loop *= 10
 
     def _calc_elapsed(self, start_at, end_at, empty_bench_elapsed):
         user_time = end_at[0][0] - start_at[0][0]
         sys_time  = end_at[0][1] - start_at[0][1]
-        real_time = end_at[1]    - start_at[1]
+        clock = self.clock or _get_clock(None)
+        real_time = clock.elapsed(start_at[1], end_at[1])
+        too_short = clock.is_too_short(real_time)
+        overhead = None
         if empty_bench_elapsed:
-            user_time -= empty_bench_elapsed.user_time
-            sys_time  -= empty_bench_elapsed.sys_time
-            real_time -= empty_bench_elapsed.real_time
-        return Elapsed(real_time, user_time, sys_time, user_time+sys_time)
+            ## empty benchmark may have different loop count when calibrated
+            ratio = 1.0
+            if empty_bench_elapsed.loop and self._loop:
+                ratio = float(self._loop) / empty_bench_elapsed.loop
+            user_time -= empty_bench_elapsed.user_time * ratio
+            sys_time  -= empty_bench_elapsed.sys_time  * ratio
+            real_time -= empty_bench_elapsed.real_time * ratio
+        elif self.subtract_overhead:
+            overhead = self.overhead = LoopOverhead.get(self._iterations(), self._with_block,
+                                                         clock, self._tasks(), self.sampling)
+            user_time -= overhead.user_time
+            sys_time  -= overhead.sys_time
+            real_time -= overhead.real_time
+        ## never negative even if overhead is overestimated
+        user_time = max(user_time, 0.0)
+        sys_time  = max(sys_time,  0.0)
+        real_time = max(real_time, 0.0)
+        elapsed = Elapsed(real_time, user_time, sys_time, user_time+sys_time,
+                          loop=self._loop)
+        elapsed.too_short = too_short
+        if overhead:
+            elapsed.error = overhead.error
+            elapsed.overhead = overhead
+        return elapsed
 
     def _exclude_min_max(self, extra):
         if not extra:
@@ -294,14 +854,19 @@ class Benchmark(object):
         self._extra_maxs = pairs[-extra:]
         self._extra_maxs.reverse()
 
+    def _valid_results(self):
+        ## results except extra min & max
+        elapseds = self.results[:]
+        if self._extra_mins and self._extra_maxs:
+            indeces = set([ cycle for cycle, _ in self._extra_mins + self._extra_maxs ])
+            elapseds = [ el for cycle, el in enumerate(elapseds, 1)
+                             if cycle not in indeces ]
+        return elapseds
+
     @property
     def average(self):
         if self._average is None:
-            elapseds = self.results[:]
-            if self._extra_mins and self._extra_maxs:
-                indeces = set([ cycle for cycle, _ in self._extra_mins + self._extra_maxs ])
-                elapseds = [ el for cycle, el in enumerate(elapseds, 1)
-                                 if cycle not in indeces ]
+            elapseds = self._valid_results()
             num = float(len(elapseds))
             self._average = Elapsed(
                 sum( el.real_time  for el in elapseds ) / num,
@@ -311,19 +876,940 @@ class Benchmark(object):
             )
         return self._average
 
+    @property
+    def latency(self):
+        """percentiles of latency per iteration ('--latency'), or None."""
+        pairs = []
+        for el in self._valid_results():
+            pairs.extend(el.latencies or ())
+        if not pairs:
+            return None
+        pairs.sort()
+        d = dict( ("p%s" % p, _weighted_percentile(pairs, p)) for p in (50, 90, 99) )
+        d["max"] = pairs[-1][0]
+        d["ops"] = sum( n for _, n in pairs )
+        return d
+
+    @property
+    def stats(self):
+        """statistics of real time (except extra min & max)."""
+        if self._stats is None:
+            elapseds = self._valid_results()
+            error = max([ el.error for el in elapseds ] or [0.0])
+            self._stats = Statistics([ el.real_time for el in elapseds ], error)
+        return self._stats
+
+
+def _parse_param_value(s):
+    ## '10' -> 10, '0.5' -> 0.5, 'abc' -> 'abc'
+    for conv in (int, float):
+        try:
+            return conv(s)
+        except ValueError:
+            pass
+    return s
+
+
+def _is_coroutine_function(func):
+    import inspect
+    fn = getattr(inspect, 'iscoroutinefunction', None)   # Python 3.5 or later
+    return bool(fn and fn(func))
+
+
+_event_loops = {}
+
+def _event_loop():
+    ## event loop to run async benchmarks, reused across cycles
+    ## (created for each process, because it is not fork-safe)
+    import asyncio
+    pid = os.getpid()
+    loop = _event_loops.get(pid)
+    if loop is None or loop.is_closed():
+        loop = _event_loops[pid] = asyncio.new_event_loop()
+    return loop
+
+
+def _close_event_loop():
+    loop = _event_loops.pop(os.getpid(), None)
+    if loop is not None:
+        loop.close()
+
+
+class LoopOverhead(object):
+    """
+    Cost of 'for _ in bm' (and 'with bm:', or running coroutine on event loop),
+    measured by repeating empty benchmark and subtracted from results automatically.
+    Median of repeated runs is used, and 'error' is its standard error.
+    """
+
+    MIN_REPEAT  = 5
+    MAX_REPEAT  = 31
+    TIME_BUDGET = 1.0     # sec
+
+    _cache = {}
+
+    def __init__(self, loop, with_block, clock, tasks=0, sampling=False):
+        self.loop       = loop
+        self.with_block = with_block
+        self.clock      = clock
+        self.tasks      = tasks   # number of concurrent tasks (0 if not async)
+        self.sampling   = sampling  # whether latency of iterations is sampled
+        self.real_time  = self.user_time = self.sys_time = None
+        self.latency    = None    # per-iteration overhead of latency samples
+        self.error      = None
+        self.repeat     = 0
+
+    @classmethod
+    def get(cls, loop, with_block, clock, tasks=0, sampling=False):
+        key = (clock.name, loop, with_block, tasks, sampling)
+        overhead = cls._cache.get(key)
+        if overhead is None:
+            overhead = cls._cache[key] = cls(loop, with_block, clock, tasks, sampling).measure()
+        return overhead
+
+    def measure(self):
+        def empty(bm):
+            for _ in bm:
+                pass
+        def empty_with_block(bm):
+            with bm:
+                for _ in bm:
+                    pass
+        def empty_async(bm):
+            (empty_with_block if self.with_block else empty)(bm)
+            import asyncio
+            return asyncio.sleep(0)   # coroutine which does nothing
+        if self.tasks:
+            bm = Benchmark(None, self.loop)(empty_async)
+            bm.is_async    = True
+            bm.concurrency = self.tasks
+        else:
+            bm = Benchmark(None, self.loop)(empty_with_block if self.with_block else empty)
+        bm.clock = self.clock
+        bm._not_yet = False
+        reals, users, syss, lats = [], [], [], []
+        total = 0.0
+        while len(reals) < self.MAX_REPEAT:
+            if len(reals) >= self.MIN_REPEAT and total >= self.TIME_BUDGET:
+                break
+            ## iterating 'bm' costs more when latency is sampled
+            latencies = bm._latencies = [] if self.sampling else None
+            start_at, end_at = bm._measure()
+            if latencies:
+                lats.append(sum( t * n for t, n in latencies )
+                            / sum( n for _, n in latencies ))
+            real = self.clock.elapsed(start_at[1], end_at[1])
+            reals.append(real)
+            users.append(end_at[0][0] - start_at[0][0])
+            syss.append(end_at[0][1] - start_at[0][1])
+            total += real
+        self.repeat    = len(reals)
+        self.real_time = _median(reals)
+        self.user_time = _median(users)
+        self.sys_time  = _median(syss)
+        self.latency   = _median(lats) if lats else None
+        ## standard error of median (estimated from MAD)
+        self.error = 1.2533 * 1.4826 * _mad(reals) / len(reals) ** 0.5
+        return self
+
+    def __getstate__(self):
+        ## clock object is not picklable (sent from worker process)
+        d = self.__dict__.copy()
+        d['clock'] = self.clock.name
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self.clock = _get_clock(d['clock'])
+
+
+class Complexity(object):
+    """
+    Best fit of samples (ex: time per op for each input size 'n') against
+    complexity classes, by least squares of 'y = coef * f(n)'.
+    'rms' is root mean square of residuals, normalized by mean of samples.
+    """
+
+    MIN_SIZES = 3
+    CLASSES = (
+        ("O(1)",       lambda n: 1.0),
+        ("O(log n)",   lambda n: math.log(n, 2)),
+        ("O(n)",       lambda n: float(n)),
+        ("O(n log n)", lambda n: n * math.log(n, 2)),
+        ("O(n^2)",     lambda n: float(n) * n),
+    )
+
+    def __init__(self, fit, coef, rms, candidates=None):
+        self.fit  = fit     # name of complexity class (ex: 'O(n log n)')
+        self.coef = coef
+        self.rms  = rms
+        self.candidates = candidates or []  # list of (fit, coef, rms)
+
+    @classmethod
+    def fit(cls, sizes, values):
+        mean = sum(values) / float(len(values))
+        candidates = []
+        for name, f in cls.CLASSES:
+            xs = [ f(n) for n in sizes ]
+            denom = sum( x * x for x in xs )
+            if not denom:
+                continue
+            coef = sum( x * y for x, y in zip(xs, values) ) / denom
+            sq = sum( (y - coef * x) ** 2 for x, y in zip(xs, values) ) / len(values)
+            rms = (sq ** 0.5) / mean if mean else 0.0
+            candidates.append((name, coef, rms))
+        ## simpler class wins if residuals are equal
+        best = min(candidates, key=lambda t: t[2])
+        return cls(best[0], best[1], best[2], candidates)
+
+    def to_dict(self):
+        return {"fit": self.fit, "coef": Float('%.4g' % self.coef),
+                "rms": Float('%.4f' % self.rms)}
+
+
+class Warmup(object):
+    """
+    Warmup runs before the first cycle. 'curve' is real time of each run,
+    and 'steady' is False if it was not steady until max number of runs.
+    """
+
+    def __init__(self, curve, steady):
+        self.curve  = curve
+        self.steady = steady
+
+    @property
+    def runs(self):
+        return len(self.curve)
+
+
+class MemoryUsage(object):
+    """
+    Memory usage of timed region, measured by tracemalloc ('--memory').
+    'retained' is net number of allocated memory blocks (sys.getallocatedblocks())
+    when 'for _ in bm' is finished, therefore objects still referred by locals
+    of benchmark function are counted but temporary objects are not.
+    """
+
+    _overhead = None
+
+    def __init__(self, loop):
+        self.loop   = loop
+        self.peak     = None   # peak size (bytes) of traced memory
+        self.retained = None   # number of allocated blocks after loop - before
+        self._blocks  = None
+
+    @classmethod
+    def overhead(cls):
+        ## memory which benchmarker itself allocates in timed region
+        if cls._overhead is None:
+            def empty(bm):
+                for _ in bm:
+                    pass
+            bm = Benchmark(None, 1)(empty)
+            bm._not_yet = False
+            cls._overhead = bm._run_extra(MemoryUsage(1))
+        return cls._overhead
+
+    def _subtract(self, other):
+        self.peak     = max(self.peak - other.peak, 0)
+        self.retained = self.retained - other.retained
+
+    @property
+    def retained_per_loop(self):
+        if self.retained is None:
+            return None
+        return float(self.retained) / (self.loop or 1)
+
+    def start(self):
+        import gc, tracemalloc
+        if tracemalloc.is_tracing():    # restarted by 'with bm:'
+            tracemalloc.stop()
+        gc.collect()
+        self._blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+
+    def stop(self):
+        import gc, tracemalloc
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        gc.collect()
+        self.peak     = peak
+        self.retained = sys.getallocatedblocks() - self._blocks
+
+    ## read before locals of benchmark function are released
+    loop_end = stop
+
+
+class Profile(object):
+    """
+    Profiles benchmark by cProfile (in extra run which is not timed).
+    Frames of Benchmarker itself are excluded from top functions.
+    """
+
+    def __init__(self):
+        import cProfile
+        self._profiler = cProfile.Profile()
+        self.path = None    # filename of .pstats file
+        self.top  = []      # list of (function, ncalls, tottime, cumtime)
+
+    def start(self):
+        self._profiler.enable()
+
+    def stop(self):
+        self._profiler.disable()
+
+    def dump(self, path):
+        self._profiler.dump_stats(path)
+        self.path = path
+
+    def top_functions(self, n):
+        import pstats
+        stats = pstats.Stats(self._profiler).stats
+        is_ours = _is_this_file
+        rows = []
+        for (filename, lineno, funcname), (cc, nc, tt, ct, callers) in stats.items():
+            if filename == '~':     # built-in
+                ## ignore built-ins called only by Benchmarker (ex: clock)
+                if callers and all( is_ours(k[0]) for k in callers ):
+                    continue
+                label = funcname
+            elif is_ours(filename):
+                continue
+            else:
+                label = "%s:%s(%s)" % (os.path.basename(filename), lineno, funcname)
+            rows.append((label, nc, tt, ct))
+        rows.sort(key=lambda t: (-t[3], t[0]))
+        return rows[:n]
+
+
+def _is_this_file(filename):
+    ## True if filename is this module (ex: 'benchmarker.pyc')
+    this_file = os.path.splitext(os.path.abspath(__file__))[0]
+    return os.path.splitext(os.path.abspath(filename))[0] == this_file
+
+
+def _output_path(outfile, name, ext):
+    ## ex: ('result.json', 'sort(n=10)', '.pstats') -> 'result.sort_n_10.pstats'
+    base = os.path.splitext(outfile)[0] if outfile else "benchmark"
+    return "%s.%s%s" % (base, re.sub(r'[^-\w.]+', '_', name).strip('_'), ext)
+
+
+class StackSampler(object):
+    """
+    Statistical profiler which samples call stack of benchmark thread by
+    another thread (via sys._current_frames()) at 'rate' Hz.
+    Stacks start from 'root' (code object of benchmark function), and
+    frames of Benchmarker itself are excluded from stacks.
+    'overhead' is ratio of time spent for sampling (holding GIL) to run time.
+    """
+
+    def __init__(self, rate=1000, clock=None, root=None):
+        self.rate     = rate
+        self.root     = root
+        self.clock    = clock or _get_clock(None)
+        self.stacks   = {}      # folded stack ('a;b;c') to number of samples
+        self.samples  = 0
+        self.elapsed  = 0.0     # sec
+        self.sampling_time = 0.0
+        self.paths    = None    # filenames of folded stacks and flamegraph
+        self._thread  = None
+        self._ours    = {}      # filename to True if it is this module
+
+    @property
+    def overhead(self):
+        return self.sampling_time / self.elapsed if self.elapsed else 0.0
+
+    def start(self):
+        import threading
+        self._stop_thread()     # restarted by 'with bm:'
+        self.stacks   = {}
+        self.samples  = 0
+        self.sampling_time = 0.0
+        self._target  = threading.current_thread().ident
+        ## let sampler thread take GIL frequently enough
+        self._switch_interval = None
+        if hasattr(sys, 'setswitchinterval'):
+            self._switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(self._switch_interval, 0.5 / self.rate))
+        self._stopped = threading.Event()
+        self._thread  = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._started_at = self.clock.func()
+        self._thread.start()
+
+    def stop(self):
+        self.elapsed = self.clock.elapsed(self._started_at, self.clock.func())
+        self._stop_thread()
+
+    def _stop_thread(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        if self._switch_interval is not None:
+            sys.setswitchinterval(self._switch_interval)
+
+    def _run(self):
+        clock = self.clock
+        interval = 1.0 / self.rate
+        while not self._stopped.wait(interval):
+            t = clock.func()
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                self._add(frame)
+            self.sampling_time += clock.elapsed(t, clock.func())
+
+    def _add(self, frame):
+        ours = self._ours
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            filename = code.co_filename
+            if filename not in ours:
+                ours[filename] = _is_this_file(filename)
+            if not ours[filename]:
+                names.append("%s (%s:%s)" % (code.co_name, os.path.basename(code.co_filename),
+                                             code.co_firstlineno))
+            if code is self.root:
+                break
+            frame = frame.f_back
+        else:
+            if self.root is not None:
+                return      # not in benchmark function (ex: event loop is idle)
+        if names:
+            key = ";".join(reversed(names))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def folded(self):
+        ## collapsed stacks which are readable by flamegraph.pl or speedscope
+        return "".join( "%s %s\n" % (k, self.stacks[k]) for k in sorted(self.stacks) )
+
+    def dump(self, basepath, title):
+        folded_path, svg_path = basepath + ".folded", basepath + ".svg"
+        with open(folded_path, 'w') as f:
+            f.write(self.folded())
+        with open(svg_path, 'w') as f:
+            f.write(_render_flamegraph(self.stacks, title))
+        self.paths = (folded_path, svg_path)
+
+
+def _render_flamegraph(stacks, title, width=1200, height=16):
+    ## self-contained SVG flamegraph (root at bottom, width = samples)
+    def escape(s):
+        return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+    root = [0, {}]      # [samples, {name: child}]
+    for stack, n in stacks.items():
+        root[0] += n
+        node = root
+        for name in stack.split(";"):
+            node = node[1].setdefault(name, [0, {}])
+            node[0] += n
+    def depth_of(node):
+        return 1 + max([ depth_of(c) for c in node[1].values() ] or [0])
+    depth = depth_of(root)
+    total = float(root[0] or 1)
+    img_height = (depth + 2) * height
+    buf = []; add = buf.append
+    add('<?xml version="1.0" standalone="no"?>\n')
+    add('<svg version="1.1" xmlns="http://www.w3.org/2000/svg" width="%d" height="%d"'
+        ' font-family="Verdana, sans-serif" font-size="11">\n' % (width + 20, img_height))
+    add('<rect x="0" y="0" width="100%%" height="100%%" fill="#f8f8f8"/>\n')
+    add('<text x="%d" y="14" text-anchor="middle" font-size="14">%s</text>\n'
+        % ((width + 20) // 2, escape(title)))
+    def render(name, node, x, level):
+        w = node[0] / total * width
+        if w < 0.1:
+            return
+        y = img_height - (level + 1) * height
+        h = sum( ord(c) for c in name ) % 60   # stable color for each function
+        label = "%s (%s samples, %.1f%%)" % (name, node[0], node[0] / total * 100.0)
+        add('<g><title>%s</title><rect x="%.1f" y="%d" width="%.1f" height="%d"'
+            ' fill="rgb(%d,%d,%d)" rx="2"/>' % (escape(label), 10 + x, y, w, height - 1,
+                                                 205 + h // 2, 100 + h * 2, 40 + h // 2))
+        chars = int(w / 7)
+        if chars >= 3:
+            text = name if len(name) <= chars else name[:chars - 2] + ".."
+            add('<text x="%.1f" y="%d">%s</text>' % (10 + x + 3, y + height - 4, escape(text)))
+        add('</g>\n')
+        for child_name in sorted(node[1]):
+            child = node[1][child_name]
+            render(child_name, child, x, level + 1)
+            x += child[0] / total * width
+    render("all", root, 0.0, 0)
+    add('</svg>\n')
+    return "".join(buf)
+
+
+class _GCProbe(object):
+    """
+    Applies GC policy in timed region, and counts GC collections and
+    their pause time by gc.callbacks.
+
+    * 'enable'  -- leave GC enabled
+    * 'disable' -- disable GC while timing
+    * 'freeze'  -- move all objects to permanent generation by gc.freeze()
+                   before timing, therefore GC doesn't scan them
+    """
+
+    POLICIES = ('enable', 'disable', 'freeze')
+
+    def __init__(self, policy, clock=None):
+        self.policy = policy
+        self.clock  = clock or _get_clock(None)
+        self.collections = [0, 0, 0]
+        self.pause  = 0.0
+        self._gc_started_at = None
+        self._restore = None
+
+    @classmethod
+    def validate(cls, policy):
+        import gc
+        if policy not in cls.POLICIES:
+            raise BenchmarkerError("gc=%r: expected one of %s." % (policy, ", ".join(cls.POLICIES)))
+        if policy == 'freeze' and not hasattr(gc, 'freeze'):
+            raise BenchmarkerError("gc='freeze': requires Python 3.7 or later.")
+
+    def _callback(self, phase, info):
+        if phase == 'start':
+            self._gc_started_at = self.clock.func()
+        elif self._gc_started_at is not None:
+            self.pause += self.clock.elapsed(self._gc_started_at, self.clock.func())
+            self.collections[info['generation']] += 1
+            self._gc_started_at = None
+
+    def start(self):
+        import gc
+        self._finish()     # restarted by 'with bm:'
+        self.collections = [0, 0, 0]
+        self.pause = 0.0
+        enabled = gc.isenabled()
+        if self.policy == 'disable':
+            gc.disable()
+        elif self.policy == 'freeze':
+            gc.collect()
+            gc.freeze()
+        if hasattr(gc, 'callbacks'):
+            gc.callbacks.append(self._callback)
+        def restore():
+            if self._callback in getattr(gc, 'callbacks', ()):
+                gc.callbacks.remove(self._callback)
+            if self.policy == 'freeze':
+                gc.unfreeze()
+            if enabled:
+                gc.enable()
+        self._restore = restore
+
+    def stop(self):
+        self._finish()
+
+    def _finish(self):
+        if self._restore:
+            self._restore()
+            self._restore = None
+
+
+class _RusageProbe(object):
+    """
+    Deltas of resource usage of process (by resource.getrusage()) in timed
+    region: minor and major page faults, voluntary and involuntary context
+    switches, and growth of max RSS in bytes. Unix only.
+    """
+
+    FIELDS = (      # (key, attribute of struct rusage)
+        ("minflt", "ru_minflt"),
+        ("majflt", "ru_majflt"),
+        ("nvcsw",  "ru_nvcsw"),
+        ("nivcsw", "ru_nivcsw"),
+        ("maxrss", "ru_maxrss"),
+    )
+
+    def __init__(self):
+        self.values = None
+        self._start = None
+
+    @staticmethod
+    def available():
+        try:
+            import resource
+            return True
+        except ImportError:
+            return False
+
+    def _usage(self):
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return [ getattr(usage, attr) for _, attr in self.FIELDS ]
+
+    def start(self):
+        self._start = self._usage()    # restarted by 'with bm:'
+
+    def stop(self):
+        end = self._usage()
+        self.values = dict( (key, e - s) for (key, _), s, e
+                                in zip(self.FIELDS, self._start, end) )
+        ## ru_maxrss is in kilobytes except on macOS (bytes)
+        if sys.platform != 'darwin':
+            self.values["maxrss"] *= 1024
+
+
+class PerfCounters(object):
+    """
+    Counts Linux perf events (by perf_event_open(2) via ctypes) in timed
+    region. Hardware events are used if available, otherwise falls back to
+    software events (ex: in virtual machine or container).
+    """
+
+    HARDWARE_EVENTS = (     # (name, type, config)
+        ("cycles",           0, 0),
+        ("instructions",     0, 1),
+        ("cache-references", 0, 2),
+        ("cache-misses",     0, 3),
+        ("branch-misses",    0, 5),
+    )
+    SOFTWARE_EVENTS = (
+        ("task-clock",       1, 1),     # nsec
+        ("page-faults",      1, 2),
+        ("context-switches", 1, 3),
+    )
+    SYSCALL_NUMBERS = {     # __NR_perf_event_open
+        'x86_64': 298, 'amd64': 298, 'i386': 336, 'i686': 336,
+        'aarch64': 241, 'arm64': 241, 'armv7l': 364, 'ppc64le': 319, 's390x': 331,
+    }
+    _IOC_ENABLE  = 0x2400
+    _IOC_DISABLE = 0x2401
+    _IOC_RESET   = 0x2403
+
+    _syscall = None
+
+    def __init__(self, events):
+        self.events = list(events)  # names of events
+        self.values = {}            # event name to count
+        self._fds   = []
+
+    @classmethod
+    def _perf_event_open(cls, type, config):
+        ## returns file descriptor, or raises OSError
+        import ctypes
+        if cls._syscall is None:
+            import platform
+            nr = cls.SYSCALL_NUMBERS.get(platform.machine().lower())
+            if not sys.platform.startswith('linux') or nr is None:
+                raise OSError("perf_event_open() is not available on this platform.")
+            libc = ctypes.CDLL(None, use_errno=True)
+            libc.syscall.restype = ctypes.c_long
+            cls._syscall = (libc.syscall, nr)
+        class perf_event_attr(ctypes.Structure):   # PERF_ATTR_SIZE_VER1
+            _fields_ = [("type",          ctypes.c_uint32),
+                        ("size",          ctypes.c_uint32),
+                        ("config",        ctypes.c_uint64),
+                        ("sample_period", ctypes.c_uint64),
+                        ("sample_type",   ctypes.c_uint64),
+                        ("read_format",   ctypes.c_uint64),
+                        ("flags",         ctypes.c_uint64),
+                        ("wakeup_events", ctypes.c_uint32),
+                        ("bp_type",       ctypes.c_uint32),
+                        ("config1",       ctypes.c_uint64),
+                        ("config2",       ctypes.c_uint64)]
+        attr = perf_event_attr(type=type, size=ctypes.sizeof(perf_event_attr),
+                               config=config,
+                               read_format=1|2,           # TOTAL_TIME_ENABLED|RUNNING
+                               flags=1|(1<<5)|(1<<6))     # disabled, exclude_kernel, exclude_hv
+        syscall, nr = cls._syscall
+        fd = syscall(nr, ctypes.byref(attr), 0, -1, -1, 0)  # this thread, any cpu
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return fd
+
+    @classmethod
+    def available_events(cls):
+        ## names of hardware events which can be opened, or software events
+        ## if no hardware event is available; raises BenchmarkerError if none
+        error = None
+        for events in (cls.HARDWARE_EVENTS, cls.SOFTWARE_EVENTS):
+            names = []
+            for name, type, config in events:
+                try:
+                    os.close(cls._perf_event_open(type, config))
+                    names.append(name)
+                except OSError:
+                    error = sys.exc_info()[1]
+            if names:
+                return names
+        raise BenchmarkerError("counters=True: perf events are not available (%s)." % (error,))
+
+    def open(self):
+        table = dict( (name, (type, config)) for name, type, config
+                          in self.HARDWARE_EVENTS + self.SOFTWARE_EVENTS )
+        self._fds = [ (name, self._perf_event_open(*table[name])) for name in self.events ]
+        return self
+
+    def close(self):
+        for _, fd in self._fds:
+            os.close(fd)
+        self._fds = []
+
+    def start(self):
+        import fcntl
+        for _, fd in self._fds:
+            fcntl.ioctl(fd, self._IOC_RESET, 0)
+            fcntl.ioctl(fd, self._IOC_ENABLE, 0)
+
+    def stop(self):
+        import fcntl, struct
+        for _, fd in self._fds:
+            fcntl.ioctl(fd, self._IOC_DISABLE, 0)
+        for name, fd in self._fds:
+            value, enabled, running = struct.unpack("QQQ", os.read(fd, 24))
+            ## scale if counter was multiplexed with other events
+            if running and running < enabled:
+                value = int(value * float(enabled) / running)
+            self.values[name] = value
+
+
+class _InProcessRunner(object):
+    """
+    start() returns a function which returns (elapsed, skipped).
+    Benchmark runs when the function is called.
+    """
+
+    def start(self, bm, empty_bench_elapsed):
+        return lambda: bm.run(empty_bench_elapsed)
+
+    def finish(self, bm):
+        pass
+
+    def close(self):
+        pass
+
+
+_isolated_benchmarks = None     # inherited by forked worker processes
+
+
+def _run_isolated(index, loop, empty_bench_elapsed):
+    bm = _isolated_benchmarks[index]
+    bm._loop = loop
+    return bm._run(empty_bench_elapsed)
+
+
+class _IsolatedRunner(object):
+    """
+    Runs each benchmark in forked worker process, in order not to be affected
+    by heap, caches or GC state which other benchmarks left.
+    isolate='process' reuses a worker per benchmark for all cycles, and
+    isolate='cycle' forks a fresh worker for each cycle.
+    """
+
+    def __init__(self, benchmarks, mode):
+        global _isolated_benchmarks
+        if not hasattr(os, 'fork'):
+            raise BenchmarkerError("isolate=%r: not supported on this platform." % (mode,))
+        import multiprocessing
+        self._mp = multiprocessing
+        if hasattr(multiprocessing, 'get_context'):
+            self._mp = multiprocessing.get_context('fork')
+        _isolated_benchmarks = benchmarks
+        self.benchmarks = benchmarks
+        self.mode  = mode
+        self._pools = {}
+
+    def _pool(self, index):
+        key = index if self.mode == 'process' else None
+        pool = self._pools.get(key)
+        if pool is None:
+            maxtasks = 1 if self.mode == 'cycle' else None
+            pool = self._pools[key] = self._mp.Pool(1, maxtasksperchild=maxtasks)
+        return pool
+
+    def start(self, bm, empty_bench_elapsed):
+        def get_result():
+            return self._submit(bm, empty_bench_elapsed)()
+        return get_result
+
+    def _submit(self, bm, empty_bench_elapsed):
+        index = self.benchmarks.index(bm)
+        args = (index, bm._loop, empty_bench_elapsed)
+        async_result = self._pool(index).apply_async(_run_isolated, args)
+        def get_result():
+            elapsed, skipped = async_result.get()
+            bm._add_result(elapsed, skipped)
+            return elapsed, skipped
+        return get_result
+
+    def finish(self, bm):
+        ## closes worker of benchmark after its last cycle ('process' mode)
+        if self.mode != 'process':
+            return
+        pool = self._pools.pop(self.benchmarks.index(bm), None)
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def close(self):
+        global _isolated_benchmarks
+        for pool in self._pools.values():
+            pool.close()
+            pool.join()
+        self._pools.clear()
+        _isolated_benchmarks = None
+
+
+def _pin_cpu(cpu):
+    if cpu is not None:
+        os.sched_setaffinity(0, [cpu])
+
+
+class _ParallelRunner(_IsolatedRunner):
+    """
+    Runs benchmarks in parallel on 'jobs' worker processes ('--jobs=N').
+    Each worker is pinned to a dedicated cpu, and each benchmark runs on
+    the same worker (= the same cpu) in all cycles.
+    """
+
+    def __init__(self, benchmarks, jobs, cpus):
+        _IsolatedRunner.__init__(self, benchmarks, 'process')
+        self.jobs = jobs
+        self.cpus = cpus
+
+    def _pool(self, index):
+        slot = index % self.jobs
+        pool = self._pools.get(slot)
+        if pool is None:
+            pool = self._pools[slot] = self._mp.Pool(1, initializer=_pin_cpu,
+                                                     initargs=(self.cpus[slot],))
+        return pool
+
+    def start(self, bm, empty_bench_elapsed):
+        return self._submit(bm, empty_bench_elapsed)   # start immediately
+
+    def finish(self, bm):
+        pass    # worker is shared with other benchmarks
+
+
+def _select_cpus(n):
+    """
+    Returns n cpu ids. One logical cpu per physical core is preferred
+    in order to avoid SMT siblings (hyper-threading).
+    Returns [None]*n if cpu affinity is not supported on the platform.
+    """
+    if not hasattr(os, 'sched_getaffinity'):
+        return [None] * n
+    primaries, siblings = [], []
+    cores = set()
+    for cpu in sorted(os.sched_getaffinity(0)):
+        core = _cpu_core_id(cpu)
+        if core in cores:
+            siblings.append(cpu)
+        else:
+            primaries.append(cpu)
+            cores.add(core)
+    cpus = primaries + siblings
+    if n > len(cpus):
+        raise BenchmarkerError("jobs=%s: only %s cpus available." % (n, len(cpus)))
+    return cpus[:n]
+
+
+def _cpu_core_id(cpu):
+    fname = "/sys/devices/system/cpu/cpu%s/topology/thread_siblings_list" % cpu
+    try:
+        with open(fname) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return str(cpu)
+
 
 class Elapsed(object):
 
-    def __init__(self, real_time, user_time, sys_time, total_time):
+    def __init__(self, real_time, user_time, sys_time, total_time, loop=None):
         self.real_time  = real_time
         self.user_time  = user_time
         self.sys_time   = sys_time
         self.total_time = total_time
+        self.loop       = loop
+        self.too_short  = False    # too short compared to clock resolution
+        self.gc_collections = None # number of GC per generation in timed region
+        self.gc_pause       = None # total time (sec) of GC in timed region
+        self.counters       = None # dict of perf event name to count ('--counters')
+        self.warmup         = None # Warmup object if warmed up before this run
+        self.latencies      = None # list of (latency per iteration, iterations)
+        self.overhead       = None # LoopOverhead object subtracted
+        self.error          = 0.0  # uncertainty (sec) of real time due to subtraction
+        self.rusage         = None # dict of deltas of getrusage() in timed region
 
     def __iter__(self):
         return iter((self.real_time, self.total_time, self.user_time, self.sys_time))
 
 
+class Clock(object):
+    """
+    Clock to measure real time. 'func' returns current time in 'unit' sec
+    (ex: 1e-9 for time.perf_counter_ns()).
+    """
+
+    WARN_TICKS = 10     # warn when elapsed time is less than N ticks
+
+    def __init__(self, name, func, unit=1.0):
+        self.name       = name
+        self.func       = func
+        self.unit       = unit
+        self.resolution = None     # in sec
+        self.overhead   = None     # in sec
+
+    def elapsed(self, start, end):
+        return (end - start) * self.unit
+
+    def calibrate(self, n=1000):
+        if self.resolution is not None:
+            return self
+        func = self.func
+        ## resolution: minimum difference of successive (and different) values
+        deltas = []
+        for _ in xrange(20):
+            t1 = t2 = func()
+            while t2 == t1:
+                t2 = func()
+            deltas.append(t2 - t1)
+        self.resolution = min(deltas) * self.unit
+        ## overhead: average time to call func()
+        t1 = func()
+        for _ in xrange(n):
+            func()
+        t2 = func()
+        self.overhead = (t2 - t1) * self.unit / n
+        return self
+
+    def is_too_short(self, real_time):
+        if self.resolution is None:
+            return False
+        return real_time < self.resolution * self.WARN_TICKS
+
+
+def _available_clocks():
+    import time
+    clocks = {}
+    for name in ('perf_counter_ns', 'process_time_ns', 'thread_time_ns', 'monotonic_ns'):
+        func = getattr(time, name, None)
+        if func is not None:
+            clocks[name] = Clock(name, func, 1e-9)
+    clocks['time'] = Clock('time', _time_time)
+    return clocks
+
+CLOCKS = _available_clocks()
+DEFAULT_CLOCK = 'perf_counter_ns' if 'perf_counter_ns' in CLOCKS else 'time'
+
+
+def _get_clock(name):
+    clock = CLOCKS.get(name or DEFAULT_CLOCK)
+    if clock is None:
+        raise BenchmarkerError("%s: unknown clock (available: %s)."
+                               % (name, ", ".join(sorted(CLOCKS))))
+    return clock
+
+
 class Skip(Exception):
     pass
 
@@ -344,6 +1830,248 @@ class Float(float):
         return self._value
 
 
+def _mean(values):
+    return sum(values) / float(len(values))
+
+
+def _percentile(sorted_values, p):
+    ## linear interpolation between closest ranks
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100.0
+    i = int(k)
+    if i + 1 >= len(sorted_values):
+        return sorted_values[-1]
+    return sorted_values[i] + (sorted_values[i+1] - sorted_values[i]) * (k - i)
+
+
+def _weighted_percentile(sorted_pairs, p):
+    ## sorted_pairs: sorted list of (value, weight)
+    threshold = sum( w for _, w in sorted_pairs ) * p / 100.0
+    acc = 0
+    for value, weight in sorted_pairs:
+        acc += weight
+        if acc >= threshold:
+            return value
+    return sorted_pairs[-1][0]
+
+
+def _median(values):
+    return _percentile(sorted(values), 50)
+
+
+def _mad(values):
+    ## median absolute deviation
+    m = _median(values)
+    return _median([ abs(x - m) for x in values ])
+
+
+def _stddev(values):
+    ## sample standard deviation
+    n = len(values)
+    if n < 2:
+        return 0.0
+    m = _mean(values)
+    return (sum( (x - m) ** 2 for x in values ) / (n - 1)) ** 0.5
+
+
+def _bootstrap_ci(values, statistic=_median, confidence=0.95, n=1000, seed=0):
+    ## percentile bootstrap confidence interval (seeded to be reproducible)
+    import random
+    rand = random.Random(seed)
+    size = len(values)
+    estimates = sorted( statistic([ values[rand.randrange(size)] for _ in xrange(size) ])
+                            for _ in xrange(n) )
+    alpha = (1.0 - confidence) / 2 * 100
+    return (_percentile(estimates, alpha), _percentile(estimates, 100 - alpha))
+
+
+def _mann_whitney_u(xs, ys):
+    """
+    Mann-Whitney U test (two-sided). Returns (U, p-value).
+    Exact distribution is used for small samples without ties,
+    otherwise normal approximation with tie correction.
+    """
+    m, n = len(xs), len(ys)
+    if not m or not n:
+        return None, None
+    pairs = sorted([ (v, 0) for v in xs ] + [ (v, 1) for v in ys ])
+    ## rank with ties averaged
+    ranks = [0.0] * len(pairs)
+    ties = []
+    i = 0
+    while i < len(pairs):
+        j = i
+        while j + 1 < len(pairs) and pairs[j+1][0] == pairs[i][0]:
+            j += 1
+        for k in xrange(i, j+1):
+            ranks[k] = (i + j) / 2.0 + 1
+        if j > i:
+            ties.append(j - i + 1)
+        i = j + 1
+    r1 = sum( r for r, (_, g) in zip(ranks, pairs) if g == 0 )
+    u1 = r1 - m * (m + 1) / 2.0
+    u = min(u1, m * n - u1)
+    if not ties and m <= 20 and n <= 20:
+        counts = _mann_whitney_counts(m, n)
+        total = float(sum(counts))
+        p = 2 * sum(counts[:int(u) + 1]) / total
+        return u1, min(p, 1.0)
+    mu = m * n / 2.0
+    N = m + n
+    var = m * n / 12.0 * ((N + 1) - sum( t**3 - t for t in ties ) / float(N * (N - 1)))
+    if var <= 0:
+        return u1, 1.0
+    z = (abs(u1 - mu) - 0.5) / var ** 0.5    # with continuity correction
+    p = math.erfc(max(z, 0.0) / 2 ** 0.5)
+    return u1, min(p, 1.0)
+
+
+def _mann_whitney_counts(m, n):
+    ## counts[u] = number of arrangements whose U statistic is u
+    ## (recurrence: f(m, n, u) = f(m-1, n, u-n) + f(m, n-1, u))
+    table = {}
+    def f(m, n):
+        key = (m, n)
+        if key not in table:
+            if m == 0 or n == 0:
+                table[key] = [1]
+            else:
+                a, b = f(m - 1, n), f(m, n - 1)
+                counts = [0] * (m * n + 1)
+                for u, c in enumerate(a):
+                    counts[u + n] += c
+                for u, c in enumerate(b):
+                    counts[u] += c
+                table[key] = counts
+        return table[key]
+    return f(m, n)
+
+
+def _load_result_file(filename):
+    """
+    Loads JSON file written by '-o' option and returns dict of
+    benchmark name to samples of real time (except ignored min & max),
+    ordered as in the file.
+    """
+    import json
+    from collections import OrderedDict
+    with open(filename) as f:
+        json_data = json.load(f)
+    ignores = {}
+    for d in json_data.get("Ignore") or []:
+        ignores[d['name']] = set( x['cycle'] for x in d['min'] + d['max'] )
+    samples = OrderedDict()
+    for d in json_data.get("Result") or []:
+        ignored = ignores.get(d['name'], ())
+        samples[d['name']] = [ real for cycle, real in enumerate(d['real'], 1)
+                                   if cycle not in ignored ]
+    return samples
+
+
+def _compare_samples(base, current, alpha=0.05):
+    """
+    Compares two samples of real time by medians and Mann-Whitney U test.
+    Returns dict which contains 'verdict' ('faster', 'slower' or 'unchanged').
+    """
+    base_median, curr_median = _median(base), _median(current)
+    _, p = _mann_whitney_u(base, current)
+    delta = (curr_median - base_median) / base_median if base_median else None
+    if p is None or p >= alpha:
+        verdict = "unchanged"
+    elif curr_median < base_median:
+        verdict = "faster"
+    else:
+        verdict = "slower"
+    return {"base": base_median, "current": curr_median,
+            "delta": delta, "p_value": p, "verdict": verdict}
+
+
+class Statistics(object):
+    """
+    Robust statistics of samples (ex: real time of each cycle).
+    'ci' is bootstrap confidence interval of median, widened by 'error'
+    (uncertainty of samples, ex: loop overhead subtracted from them).
+    """
+
+    PERCENTILES = (5, 25, 50, 75, 95)
+    CONFIDENCE  = 0.95
+
+    def __init__(self, values, error=0.0):
+        values = list(values)
+        self.error  = error
+        self.values = values
+        self.n      = len(values)
+        if not values:
+            self.mean = self.median = self.mad = self.stddev = self.cv = None
+            self.percentiles = {}
+            self.ci = (None, None)
+            return
+        sorted_values = sorted(values)
+        self.mean   = _mean(values)
+        self.median = _percentile(sorted_values, 50)
+        self.mad    = _mad(values)
+        self.stddev = _stddev(values)
+        self.cv     = self.stddev / self.mean if self.mean else None   # coefficient of variation
+        self.percentiles = dict( (p, _percentile(sorted_values, p)) for p in self.PERCENTILES )
+        low, high   = _bootstrap_ci(values, _median, self.CONFIDENCE)
+        self.ci     = (max(low - error, 0.0), high + error)
+
+
+class JsonLinesWriter(object):
+    """
+    Appends results into file in JSON Lines format as soon as each benchmark
+    returns, therefore other tools can tail the file during long run and
+    results are not lost even if benchmark process crashes.
+    Records: 'begin' (environment), 'cycle' (result of each run of benchmark),
+    'summary' (each section of report) and 'end'.
+    """
+
+    def __init__(self, filename):
+        import json
+        self._json = json
+        self.filename = filename
+        self._file = open(filename, 'a')
+
+    def write(self, record):
+        s = self._json.dumps(record, ensure_ascii=False, sort_keys=True)
+        self._file.write(s + "\n")
+        self._file.flush()
+
+    def write_begin(self, environment):
+        self.write({"type": "begin", "time": Float('%.3f' % _time_time()),
+                    "environment": environment})
+
+    def write_cycle(self, cycle, bm, elapsed, skipped):
+        record = {"type": "cycle", "cycle": cycle, "name": bm.name,
+                  "time": Float('%.3f' % _time_time())}
+        if skipped:
+            record["skipped"] = str(skipped)
+        else:
+            record.update({
+                "loop" : elapsed.loop,
+                "cpu"  : bm.cpu,
+                "real" : Float('%.4f' % elapsed.real_time),
+                "total": Float('%.4f' % elapsed.total_time),
+                "user" : Float('%.4f' % elapsed.user_time),
+                "sys"  : Float('%.4f' % elapsed.sys_time),
+            })
+        self.write(record)
+
+    def write_summary(self, json_data):
+        for section in sorted(json_data):
+            if section in ("Environment", "Result"):   # already written
+                continue
+            self.write({"type": "summary", "section": section,
+                        "data": json_data[section]})
+        self.write({"type": "end", "time": Float('%.3f' % _time_time())})
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
 class Reporter(object):
 
     def __init__(self, width):
@@ -392,14 +2120,42 @@ class Reporter(object):
             ("python platform"  , platform.platform()),
             ("python executable", sys.executable),
             ("cpu model"        , _get_cpu_model() or "-"),
-            ("parameters"       , dict(loop=b.loop, cycle=b.cycle, extra=b.extra)),
+            ("parameters"       , dict(loop=b.loop, cycle=b.cycle, extra=b.extra,
+                                       isolate=b.isolate, warmup=b.warmup,
+                                       seed=b._seed)),
+            ("clock"            , dict(name=b._clock.name,
+                                       resolution=b._clock.resolution,
+                                       overhead=b._clock.overhead)),
         ]
+        if b.jobs:
+            cpus = []
+            for cpu in b._cpus[:b.jobs]:
+                names = [ bm.name or "(Empty)" for bm in b.benchmarks if bm.cpu == cpu ]
+                cpus.append((cpu, names))
+            items.append(("jobs", dict(jobs=b.jobs, cpus=cpus)))
         self.json_data["Environment"] = dict(items)
         #
         buf = []; add = buf.append
         for k, v in items:
             if k == "parameters":
-                v = "loop=%s, cycle=%s, extra=%s" % (v['loop'], v['cycle'], v['extra'])
+                d = v
+                v = "loop=%s, cycle=%s, extra=%s" % (d['loop'], d['cycle'], d['extra'])
+                if d['isolate']:
+                    v += ", isolate=%s" % d['isolate']
+                if d['warmup']:
+                    v += ", warmup=%s" % d['warmup']
+                if d['seed'] is not None:
+                    v += ", paired (seed=%s)" % d['seed']
+            elif k == "jobs":
+                add("## %-20s %s\n" % ("jobs:", v['jobs']))
+                for cpu, names in v['cpus']:
+                    k = "cpu %s" % ("-" if cpu is None else cpu)
+                    add("##   %-18s %s\n" % (k+":", ", ".join(names)))
+                continue
+            elif k == "clock":
+                v = "%s (resolution=%s, overhead=%s)" % (
+                        v['name'], _format_nsec(v['resolution']),
+                        _format_nsec(v['overhead']))
             add("## %-20s %s\n" % (k+":", v))
         add("\n")
         return "".join(buf)
@@ -412,6 +2168,8 @@ class Reporter(object):
             elapseds = bm.results
             items.append({
                 "name" : bm.name,
+                "loop" : bm.loop,
+                "cpu"  : bm.cpu,
                 "real" : [ Float('%.4f' % el.real_time)  for el in elapseds ],
                 "total": [ Float('%.4f' % el.total_time) for el in elapseds ],
                 "user" : [ Float('%.4f' % el.user_time)  for el in elapseds ],
@@ -421,25 +2179,95 @@ class Reporter(object):
         #
         return ""
 
-    def report_ignores(self, benchmarks):
+    def report_resolution_warnings(self, benchmarks, clock):
         items = []
         for bm in benchmarks:
-            if bm.skipped:
-                continue
-            mins = [ {"real": Float("%.4f" % real_time), "cycle": cycle}
-                         for cycle, real_time in bm._extra_mins ]
-            maxs = [ {"real": Float("%.4f" % real_time), "cycle": cycle}
-                         for cycle, real_time in bm._extra_maxs ]
-            items.append({
-                "name": bm.name,
-                "min":  mins,
-                "max":  maxs,
-            })
-        self.json_data["Ignore"] = items
+            cycles = [ i for i, el in enumerate(bm.results, 1) if el.too_short ]
+            if cycles:
+                items.append({"name": bm.name, "cycles": cycles})
+        if not items:
+            return ""
+        self.json_data["Warning"] = items
         #
         buf = []; add = buf.append
-        s = "## Ignore min & max"
-        if len(s) > self.width:
+        add("## Warning: too short to measure (< %s ticks of %s resolution)\n"
+            % (clock.WARN_TICKS, clock.name))
+        for d in items:
+            add(self._header_format % d['name'])
+            add(" %s\n" % " ".join( "(#%s)" % c for c in d['cycles'] ))
+        add("\n")
+        return "".join(buf)
+
+    def report_warmup(self, benchmarks):
+        items = []
+        for bm in benchmarks:
+            if bm.skipped or bm.warmup is None:
+                continue
+            w = bm.warmup
+            items.append({
+                "name":   bm.name,
+                "runs":   w.runs,
+                "steady": w.steady,
+                "curve":  [ Float('%.4f' % t) for t in w.curve ],
+            })
+        self.json_data["Warmup"] = items
+        #
+        buf = []; add = buf.append
+        add(self._header_format % "## Warmup")
+        add("      runs  steady  curve (real)\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            add(" %9s  %6s  %s\n" % (d['runs'], "yes" if d['steady'] else "no",
+                                     " ".join( str(t) for t in d['curve'] )))
+        add("\n")
+        return "".join(buf)
+
+    def report_overhead(self, benchmarks):
+        items = []
+        for bm in benchmarks:
+            ov = bm.overhead
+            if bm.skipped or ov is None:
+                continue
+            items.append({
+                "name":   bm.name,
+                "loop":   ov.loop,
+                "with":   ov.with_block,
+                "real":   Float('%.9f' % ov.real_time),
+                "error":  Float('%.9f' % ov.error),
+                "repeat": ov.repeat,
+            })
+        self.json_data["Overhead"] = items
+        #
+        buf = []; add = buf.append
+        add(self._header_format % "## Loop overhead")
+        add("      loop      real     error  (subtracted)\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            add(" %9s %9s %9s  %s\n" % (d['loop'], _format_duration(float(d['real'])),
+                                        _format_duration(float(d['error'])),
+                                        "with bm:" if d['with'] else "for _ in bm"))
+        add("\n")
+        return "".join(buf)
+
+    def report_ignores(self, benchmarks):
+        items = []
+        for bm in benchmarks:
+            if bm.skipped:
+                continue
+            mins = [ {"real": Float("%.4f" % real_time), "cycle": cycle}
+                         for cycle, real_time in bm._extra_mins ]
+            maxs = [ {"real": Float("%.4f" % real_time), "cycle": cycle}
+                         for cycle, real_time in bm._extra_maxs ]
+            items.append({
+                "name": bm.name,
+                "min":  mins,
+                "max":  maxs,
+            })
+        self.json_data["Ignore"] = items
+        #
+        buf = []; add = buf.append
+        s = "## Ignore min & max"
+        if len(s) > self.width:
             s = "## Ignore"
         add(self._header_format % s)
         add("       min     cycle       max     cycle\n")
@@ -487,14 +2315,535 @@ class Reporter(object):
         add("\n")
         return "".join(buf)
 
-    def report_ranking(self, benchmarks):
-        pairs = [ (bm.name, bm.average.real_time)
+    def _ranking_pairs(self, benchmarks):
+        ## compare time per operation, because loop count can differ
+        ## among benchmarks when it is calibrated ('-n auto'), and each of
+        ## concurrent tasks runs loop ('--concurrency=N')
+        ## (time can be zero when loop overhead is subtracted, regard it as 1ns)
+        pairs = [ (bm.name, bm.average.real_time,
+                   max(bm.average.real_time, 1e-9) / ((bm.loop or 1) * max(bm._tasks(), 1)))
                       for bm in benchmarks if not bm.skipped ]
-        pairs.sort(key=lambda t: t[1])
-        base_time = pairs[0][1] if pairs else None
+        pairs.sort(key=lambda t: t[2])
+        return pairs
+
+    def _param_tables(self, benchmarks):
+        ## groups parametrized benchmarks into tables (last parameter as columns);
+        ## returns list of (group, col_key, cols, rows) where rows is a list of
+        ## (label, {col: benchmark})
+        groups = []
+        for bm in benchmarks:
+            if bm.group and bm.group not in groups:
+                groups.append(bm.group)
+        tables = []
+        for group in groups:
+            bms = [ bm for bm in benchmarks if bm.group == group ]
+            col_key = bms[0].param_names[-1]
+            cols, rows, cells = [], [], {}
+            for bm in bms:
+                col = bm.params[col_key]
+                row = tuple( (k, bm.params[k]) for k in bm.param_names[:-1] )
+                if col not in cols: cols.append(col)
+                if row not in rows:
+                    rows.append(row)
+                    cells[row] = {}
+                cells[row][col] = bm
+            labels = [ "%s(%s)" % (group, ", ".join( "%s=%s" % kv for kv in row ))
+                           if row else group  for row in rows ]
+            tables.append((group, col_key, cols,
+                           [ (label, cells[row]) for label, row in zip(labels, rows) ]))
+        return tables
+
+    def report_params(self, benchmarks):
+        items = []
+        buf = []; add = buf.append
+        for group, col_key, cols, rows in self._param_tables(benchmarks):
+            add(self._header_format % ("## %s (real)" % group))
+            add("".join( " %9s" % ("%s=%s" % (col_key, c)) for c in cols ))
+            add("\n")
+            for label, cells in rows:
+                add(self._header_format % label)
+                for col in cols:
+                    bm = cells.get(col)
+                    real = None if bm is None or bm.skipped else Float('%.4f' % bm.average.real_time)
+                    add(" %9s" % ("-" if real is None else real))
+                    if bm is not None:
+                        items.append({"group": group, "name": bm.name,
+                                      "params": bm.params, "real": real})
+                add("\n")
+            add("\n")
+        self.json_data["Params"] = items
+        return "".join(buf)
+
+    def _size_series(self, benchmarks):
+        ## for each parameter of which values are all positive numbers, returns
+        ## list of (label, param, [(size, benchmark)]) with other parameters fixed
+        def is_size(v):
+            return isinstance(v, (int, float)) and not isinstance(v, bool) and v > 0
+        groups = []
+        for bm in benchmarks:
+            if bm.group and bm.group not in groups:
+                groups.append(bm.group)
+        series = []
+        for group in groups:
+            bms = [ bm for bm in benchmarks if bm.group == group ]
+            names = bms[0].param_names
+            for key in names:
+                if not all( is_size(bm.params[key]) for bm in bms ):
+                    continue
+                rows, cells = [], {}
+                for bm in bms:
+                    row = tuple( (k, bm.params[k]) for k in names if k != key )
+                    if row not in cells:
+                        rows.append(row)
+                        cells[row] = []
+                    if not bm.skipped:
+                        cells[row].append((bm.params[key], bm))
+                for row in rows:
+                    label = ("%s(%s)" % (group, ", ".join( "%s=%s" % kv for kv in row ))
+                                 if row else group)
+                    series.append((label, key, sorted(cells[row], key=lambda t: t[0])))
+        return series
+
+    def report_complexity(self, benchmarks, memory=False):
+        items = []
+        for label, key, bms in self._size_series(benchmarks):
+            if len(bms) < Complexity.MIN_SIZES:
+                continue
+            sizes = [ size for size, _ in bms ]
+            ## time per op (loop count can differ among sizes)
+            times = [ bm.average.real_time / (bm.loop or 1) for _, bm in bms ]
+            item = {"name": label, "param": key,
+                    "time": Complexity.fit(sizes, times).to_dict()}
+            if memory and all( bm.memory and bm.memory.peak is not None for _, bm in bms ):
+                peaks = [ float(bm.memory.peak) for _, bm in bms ]
+                item["memory"] = Complexity.fit(sizes, peaks).to_dict()
+            items.append(item)
+        self.json_data["Complexity"] = items
+        if not items:
+            return ""
+        #
+        buf = []; add = buf.append
+        add(self._header_format % "## Complexity (time/op)")
+        add("        fit       coef    rms\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            t = d['time']
+            add(" %10s %10s %5.1f%%\n" % (t['fit'], _format_duration(float(t['coef'])),
+                                           float(t['rms']) * 100.0))
+        if any( "memory" in d for d in items ):
+            add("\n")
+            add(self._header_format % "## Complexity (peak memory)")
+            add("        fit       coef    rms\n")
+            for d in items:
+                m = d.get('memory')
+                if m is None:
+                    continue
+                add(self._header_format % d['name'])
+                add(" %10s %10s %5.1f%%\n" % (m['fit'], _format_bytes(float(m['coef'])),
+                                               float(m['rms']) * 100.0))
+        add("\n")
+        return "".join(buf)
+
+    def report_statistics(self, benchmarks):
+        items = []
+        for bm in benchmarks:
+            if bm.skipped:
+                continue
+            st = bm.stats
+            items.append({
+                "name":   bm.name,
+                "n":      st.n,
+                "median": Float('%.4f' % st.median),
+                "mad":    Float('%.4f' % st.mad),
+                "mean":   Float('%.4f' % st.mean),
+                "stddev": Float('%.4f' % st.stddev),
+                "cv":     Float('%.1f' % (100.0 * (st.cv or 0.0))),
+                "percentiles": dict( (str(p), Float('%.4f' % v))
+                                         for p, v in sorted(st.percentiles.items()) ),
+                "ci":     [ Float('%.4f' % st.ci[0]), Float('%.4f' % st.ci[1]) ],
+            })
+        self.json_data["Statistics"] = items
+        #
+        buf = []; add = buf.append
+        add(self._header_format % "## Statistics (real)")
+        add("    median       mad    stddev      cv%%   %2.0f%% CI of median\n"
+            % (100 * Statistics.CONFIDENCE))
+        for d in items:
+            add(self._header_format % d['name'])
+            add(" %9s %9s %9s %8s  [%s, %s]\n" % (d['median'], d['mad'], d['stddev'],
+                                                  d['cv'], d['ci'][0], d['ci'][1]))
+        add("\n")
+        return "".join(buf)
+
+    def report_statements(self, benchmarks):
+        items = []
+        for bm in benchmarks:
+            if bm.skipped or bm.stmt is None:
+                continue
+            items.append({
+                "name":   bm.name,
+                "stmt":   bm.stmt,
+                "unroll": bm.unroll,
+                "loop":   bm.loop,
+                "real":   Float('%.12f' % (bm.average.real_time / bm.loop)),
+            })
+        self.json_data["Statement"] = items
+        #
+        buf = []; add = buf.append
+        add(self._header_format % "## Time per statement")
+        add("    unroll      loop      real\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            add(" %9s %9s %9s\n" % (d['unroll'], d['loop'], _format_duration(float(d['real']))))
+        add("\n")
+        return "".join(buf)
+
+    def report_latency(self, benchmarks):
+        items = []
+        for bm in benchmarks:
+            if bm.skipped:
+                continue
+            d = bm.latency
+            if d is None:
+                continue
+            items.append({
+                "name": bm.name,
+                "ops":  d['ops'],
+                "p50":  Float('%.9f' % d['p50']),
+                "p90":  Float('%.9f' % d['p90']),
+                "p99":  Float('%.9f' % d['p99']),
+                "max":  Float('%.9f' % d['max']),
+            })
+        self.json_data["Latency"] = items
+        #
+        buf = []; add = buf.append
+        add(self._header_format % "## Latency (per op)")
+        add("       p50       p90       p99       max\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            add(" %9s %9s %9s %9s\n" % tuple( _format_duration(float(d[k]))
+                                               for k in ('p50', 'p90', 'p99', 'max') ))
+        add("\n")
+        return "".join(buf)
+
+    def report_concurrency(self, benchmarks):
+        items = []
+        for bm in benchmarks:
+            tasks = bm._tasks()
+            if bm.skipped or tasks <= 1:
+                continue
+            real = bm.average.real_time
+            d = bm.latency or {}
+            items.append({
+                "name":  bm.name,
+                "tasks": tasks,
+                "ops":   tasks * bm.loop,
+                "throughput": Float('%.1f' % (tasks * bm.loop / real if real else 0.0)),
+                "p50":   Float('%.9f' % d.get('p50', 0.0)),
+                "p99":   Float('%.9f' % d.get('p99', 0.0)),
+            })
+        self.json_data["Concurrency"] = items
+        #
+        buf = []; add = buf.append
+        add(self._header_format % "## Concurrency")
+        add("     tasks     ops/s       p50       p99\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            add(" %9s %9s %9s %9s\n" % (d['tasks'], d['throughput'],
+                                        _format_duration(float(d['p50'])),
+                                        _format_duration(float(d['p99']))))
+        add("\n")
+        return "".join(buf)
+
+    def report_memory(self, benchmarks):
+        items = []
+        for bm in benchmarks:
+            if bm.skipped or bm.memory is None:
+                continue
+            mem = bm.memory
+            items.append({
+                "name":   bm.name,
+                "peak":   mem.peak,
+                "retained": mem.retained,
+                "retained_per_loop": _format_float('%.3f', mem.retained_per_loop),
+            })
+        self.json_data["Memory"] = items
+        #
+        buf = []; add = buf.append
+        add(self._header_format % "## Memory")
+        add("      peak  retained  retained/loop\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            add(" %9s %9s %14s\n" % (_format_bytes(d['peak']), d['retained'],
+                                      d['retained_per_loop']))
+        add("\n")
+        return "".join(buf)
+
+    def report_profile(self, benchmarks):
+        items = []
+        for bm in benchmarks:
+            prof = bm.profile
+            if bm.skipped or prof is None:
+                continue
+            items.append({
+                "name": bm.name,
+                "path": prof.path,
+                "functions": [ {"function": label, "ncalls": nc,
+                                "tottime": Float('%.4f' % tt), "cumtime": Float('%.4f' % ct)}
+                               for label, nc, tt, ct in prof.top ],
+            })
+        self.json_data["Profile"] = items
+        #
+        buf = []; add = buf.append
+        add(self._header_format % "## Profile (cumulative)")
+        add("    ncalls   tottime   cumtime\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            add("  (%s)\n" % d['path'])
+            for f in d['functions']:
+                add(self._header_format % "")
+                add(" %9s %9s %9s  %s\n" % (f['ncalls'], f['tottime'], f['cumtime'], f['function']))
+        add("\n")
+        return "".join(buf)
+
+    def report_flamegraph(self, benchmarks):
+        items = []
+        for bm in benchmarks:
+            sampler = bm.stack_sampler
+            if bm.skipped or sampler is None:
+                continue
+            items.append({
+                "name":     bm.name,
+                "samples":  sampler.samples,
+                "rate":     Float('%.1f' % (sampler.samples / sampler.elapsed if sampler.elapsed else 0.0)),
+                "overhead": Float('%.4f' % sampler.overhead),
+                "folded":   sampler.paths[0],
+                "svg":      sampler.paths[1],
+            })
+        self.json_data["Flamegraph"] = items
+        #
+        buf = []; add = buf.append
+        add(self._header_format % "## Flamegraph")
+        add("   samples   rate/s  overhead\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            add(" %9s %8s %8.1f%%  (%s)\n" % (d['samples'], d['rate'],
+                                               float(d['overhead']) * 100.0, d['svg']))
+        add("\n")
+        return "".join(buf)
+
+    def report_gc(self, benchmarks):
+        items = []
+        for bm in benchmarks:
+            if bm.skipped:
+                continue
+            elapseds = [ el for el in bm.results if el.gc_collections is not None ]
+            collections = [ sum( el.gc_collections[i] for el in elapseds ) for i in xrange(3) ]
+            items.append({
+                "name":        bm.name,
+                "policy":      bm.gc or "-",
+                "cycles":      len(elapseds),
+                "collections": collections if elapseds else None,
+                "pause":       (Float('%.4f' % sum( el.gc_pause for el in elapseds ))
+                                    if elapseds else None),
+            })
+        self.json_data["GC"] = items
+        #
+        buf = []; add = buf.append
+        add(self._header_format % "## GC (total)")
+        add("    policy    gen0    gen1    gen2     pause\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            cols = d['collections'] or ("-", "-", "-")
+            add(" %9s %7s %7s %7s %9s\n" % (d['policy'], cols[0], cols[1], cols[2],
+                                            d['pause'] if d['pause'] is not None else "-"))
+        add("\n")
+        return "".join(buf)
+
+    def report_rusage(self, benchmarks):
+        keys = [ key for key, _ in _RusageProbe.FIELDS ]
+        items = []
+        for bm in benchmarks:
+            if bm.skipped:
+                continue
+            cycles = [ el.rusage for el in bm.results ]
+            usages = [ u for u in cycles if u is not None ]
+            total = None
+            if usages:
+                total = dict( (k, sum( u[k] for u in usages )) for k in keys )
+                total["maxrss"] = max( u["maxrss"] for u in usages )
+            ## cycle which has the most involuntary context switches (disturbed)
+            worst = None
+            if usages and total["nivcsw"]:
+                worst = max(( (u["nivcsw"], i) for i, u in enumerate(cycles, 1) if u ),
+                            key=lambda t: t[0])[1]
+            items.append({
+                "name":   bm.name,
+                "total":  total,
+                "worst":  worst,
+                "cycles": cycles,
+            })
+        self.json_data["Rusage"] = items
+        #
+        buf = []; add = buf.append
+        s = "## Resource usage (total)"
+        if len(s) > self.width:
+            s = "## Rusage (total)"
+        add(self._header_format % s)
+        add("    minflt    majflt     nvcsw    nivcsw    maxrss  disturbed\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            t = d['total']
+            if t is None:
+                add(" %9s %9s %9s %9s %9s  %s\n" % ("-", "-", "-", "-", "-", "-"))
+                continue
+            add(" %9s %9s %9s %9s %9s  %s\n" % (t['minflt'], t['majflt'], t['nvcsw'], t['nivcsw'],
+                                                 "+" + _format_bytes(t['maxrss']),
+                                                 "(#%s)" % d['worst'] if d['worst'] else "-"))
+        add("\n")
+        return "".join(buf)
+
+    def report_counters(self, benchmarks):
+        columns = (     # (key, label)
+            ("cycles",           "cycles"),
+            ("instructions",     "instrs"),
+            ("ipc",              "IPC"),
+            ("cache-misses",     "cache-miss"),
+            ("branch-misses",    "br-miss"),
+            ("task-clock",       "task-clock"),
+            ("page-faults",      "faults"),
+            ("context-switches", "ctx-sw"),
+        )
+        items = []
+        for bm in benchmarks:
+            if bm.skipped:
+                continue
+            elapseds = [ el for el in bm._valid_results() if el.counters is not None ]
+            if not elapseds:
+                continue
+            nloops = float(sum( el.loop or bm.loop or 1 for el in elapseds ))
+            per_loop = {}
+            for key in elapseds[0].counters:
+                per_loop[key] = sum( el.counters.get(key, 0) for el in elapseds ) / nloops
+            if per_loop.get("cycles"):
+                per_loop["ipc"] = per_loop.get("instructions", 0) / per_loop["cycles"]
+            items.append({
+                "name":     bm.name,
+                "per_loop": dict( (k, Float('%.4g' % v)) for k, v in per_loop.items() ),
+                "total":    dict( (k, sum( el.counters.get(k, 0) for el in elapseds ))
+                                      for k in elapseds[0].counters ),
+            })
+        self.json_data["Counters"] = items
+        #
+        keys = set()
+        for d in items:
+            keys.update(d['per_loop'])
+        cols = [ (k, label) for k, label in columns if k in keys ]
+        buf = []; add = buf.append
+        add(self._header_format % "## Perf (per loop)")
+        add("".join( " %10s" % label for _, label in cols ))
+        add("\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            for key, _ in cols:
+                v = d['per_loop'].get(key)
+                s = ("-"                               if v is None else
+                     _format_duration(float(v) * 1e-9) if key == "task-clock" else
+                     "%.2f" % v                        if key == "ipc" else
+                     "%.1f" % v)
+                add(" %10s" % s)
+            add("\n")
+        add("\n")
+        return "".join(buf)
+
+    def report_comparison(self, benchmarks, baseline, filename, baseline_loops=None):
         items = []
-        for name, real_time in pairs:
-            ratio = base_time / real_time
+        for bm in benchmarks:
+            if bm.skipped:
+                continue
+            base = baseline.get(bm.name)
+            if not base:
+                items.append({"name": bm.name, "verdict": "new"})
+                continue
+            ## scale baseline samples to current loop count, because loop
+            ## count can differ between runs (ex: '-n auto')
+            base_loop = (baseline_loops or {}).get(bm.name)
+            if base_loop and bm.loop and base_loop != bm.loop:
+                base = [ float(x) * bm.loop / base_loop for x in base ]
+            ## round current samples as well as samples in JSON file
+            current = [ float('%.4f' % x) for x in bm.stats.values ]
+            d = _compare_samples(base, current)
+            items.append({
+                "name":    bm.name,
+                "base":    Float('%.4f' % d['base']),
+                "current": Float('%.4f' % d['current']),
+                "delta":   _format_float('%+.1f', d['delta'] and 100.0 * d['delta']),
+                "p_value": _format_float('%.3f', d['p_value']),
+                "verdict": d['verdict'],
+            })
+        self.json_data["Compare"] = {"baseline": filename, "items": items}
+        #
+        buf = []; add = buf.append
+        add("## Compared with %s (median of real, Mann-Whitney U test)\n" % filename)
+        add(self._header_format % "##")
+        add("      base   current    delta%  p-value  verdict\n")
+        for d in items:
+            add(self._header_format % d['name'])
+            if d['verdict'] == "new":
+                add(" %9s %9s %9s %8s  %s\n" % ("-", "-", "-", "-", d['verdict']))
+                continue
+            add(" %9s %9s %9s %8s  %s\n" % (d['base'], d['current'], d['delta'],
+                                            d['p_value'] or "-", d['verdict']))
+        add("\n")
+        return "".join(buf)
+
+    def report_paired(self, benchmarks, seed):
+        ## relative difference of time per loop between benchmark and the first
+        ## one in each cycle; extra min/max of differences (not of each
+        ## benchmark) are ignored, because pair in the same cycle shares noise
+        items = []
+        base = benchmarks[0] if benchmarks else None
+        for bm in benchmarks[1:]:
+            if bm.skipped:
+                continue
+            diffs = []
+            for a, b in zip(base.results, bm.results):
+                a_time = max(a.real_time, 1e-9) / (a.loop or 1)
+                b_time = max(b.real_time, 1e-9) / (b.loop or 1)
+                diffs.append(b_time / a_time - 1.0)
+            extra = len(bm._extra_mins)
+            if extra and len(diffs) > 2 * extra:
+                diffs = sorted(diffs)[extra:-extra]
+            d = {"name": bm.name, "pairs": len(diffs), "delta": None, "ci": None,
+                 "verdict": "-"}
+            if len(diffs) >= 2:
+                low, high = _bootstrap_ci(diffs, _mean, Statistics.CONFIDENCE)
+                d["delta"]   = Float('%.2f' % (100.0 * _mean(diffs)))
+                d["ci"]      = [ Float('%.2f' % (100.0 * low)), Float('%.2f' % (100.0 * high)) ]
+                d["verdict"] = ("faster" if high < 0 else "slower" if low > 0 else "unchanged")
+            items.append(d)
+        self.json_data["Paired"] = {"baseline": base and base.name, "seed": seed, "items": items}
+        #
+        buf = []; add = buf.append
+        add("## Paired comparison with %s (seed=%s)\n" % (base and base.name, seed))
+        add(self._header_format % "##")
+        add("     pairs    delta%%     %d%% CI of delta%%   verdict\n" % (Statistics.CONFIDENCE * 100))
+        for d in items:
+            add(self._header_format % d['name'])
+            if d['ci'] is None:
+                add(" %9s %9s %20s   %s\n" % (d['pairs'], "-", "-", d['verdict']))
+                continue
+            ci = "[%+.2f, %+.2f]" % tuple(d['ci'])
+            add(" %9s %+9.2f %20s   %s\n" % (d['pairs'], d['delta'], ci, d['verdict']))
+        add("\n")
+        return "".join(buf)
+
+    def report_ranking(self, benchmarks):
+        pairs = self._ranking_pairs(benchmarks)
+        base_time = pairs[0][2] if pairs else None
+        items = []
+        for name, real_time, unit_time in pairs:
+            ratio = base_time / unit_time
             items.append({
                 "name":  name,
                 "real":  Float("%.4f" % real_time),
@@ -514,13 +2863,11 @@ class Reporter(object):
 
     def report_matrix(self, benchmarks):
         items = []
-        pairs = [ (bm.name, bm.average.real_time)
-                      for bm in benchmarks if not bm.skipped ]
-        pairs.sort(key=lambda t: t[1])
-        for name, real_time in pairs:
-            base_time = real_time
-            cols = [ Float('%.1f' % (100.0 * r_time / base_time))
-                         for _, r_time in pairs ]
+        pairs = self._ranking_pairs(benchmarks)
+        for name, real_time, unit_time in pairs:
+            base_time = unit_time
+            cols = [ Float('%.1f' % (100.0 * u_time / base_time))
+                         for _, _, u_time in pairs ]
             items.append({
                 "name": name,
                 "real": Float("%.4f" % real_time),
@@ -546,6 +2893,309 @@ class Reporter(object):
         return "".join(buf)
 
 
+class HtmlReporter(object):
+    """
+    Renders result data (Reporter.json_data, or JSON file written by '-o')
+    into a single HTML file with inline SVG charts, which works offline.
+
+    ex:
+       >>> import json
+       >>> with open("result.json") as f:
+       ...     html = HtmlReporter(json.load(f)).render()
+    """
+
+    WIDTH   = 640
+    HEIGHT  = 260
+    MARGIN  = 48
+    PALETTE = ("#4e79a7", "#f28e2b", "#e15759", "#76b7b2", "#59a14f",
+               "#edc948", "#b07aa1", "#ff9da7", "#9c755f", "#bab0ac")
+    STYLE = """
+body { font-family: sans-serif; margin: 2em; color: #222; }
+h1 { font-size: 1.4em; } h2 { font-size: 1.15em; margin-top: 2em; }
+table { border-collapse: collapse; font-size: 0.9em; }
+th, td { border: 1px solid #ccc; padding: 2px 8px; text-align: right; }
+th:first-child, td:first-child { text-align: left; }
+svg { font-size: 11px; }
+"""
+
+    def __init__(self, json_data, title="Benchmark Report"):
+        self.json_data = json_data
+        self.title = title
+
+    def render(self):
+        buf = []; add = buf.append
+        add('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n')
+        add('<title>%s</title>\n<style>%s</style>\n</head>\n<body>\n' % (_h(self.title), self.STYLE))
+        add('<h1>%s</h1>\n' % _h(self.title))
+        add(self.render_environment())
+        add(self.render_summary())
+        samples = self._samples()
+        if samples:
+            add('<h2>Real time of each cycle</h2>\n')
+            add(self.render_scatter(samples))
+            add('<h2>Distribution of real time</h2>\n')
+            add(self.render_boxplot(samples))
+        if self.json_data.get("Matrix"):
+            add('<h2>Matrix (ratio of speed)</h2>\n')
+            add(self.render_heatmap(self.json_data["Matrix"]))
+        if self.json_data.get("Params"):
+            add(self.render_scaling(self.json_data["Params"]))
+        add('</body>\n</html>\n')
+        return "".join(buf)
+
+    def _samples(self):
+        ## list of (name, [(cycle, real, ignored)])
+        ignores = {}
+        for d in self.json_data.get("Ignore") or []:
+            ignores[d['name']] = set( x['cycle'] for x in d['min'] + d['max'] )
+        samples = []
+        for d in self.json_data.get("Result") or []:
+            ignored = ignores.get(d['name'], ())
+            samples.append((d['name'], [ (cycle, float(real), cycle in ignored)
+                                         for cycle, real in enumerate(d['real'], 1) ]))
+        return samples
+
+    def _color(self, i):
+        return self.PALETTE[i % len(self.PALETTE)]
+
+    def render_environment(self):
+        env = self.json_data.get("Environment") or {}
+        buf = []; add = buf.append
+        add('<table>\n')
+        for key in sorted(env):
+            val = env[key]
+            if isinstance(val, dict):
+                val = ", ".join( "%s=%s" % (k, val[k]) for k in sorted(val) )
+            add('<tr><th>%s</th><td>%s</td></tr>\n' % (_h(key), _h(val)))
+        add('</table>\n')
+        return "".join(buf)
+
+    def render_summary(self):
+        stats = dict( (d['name'], d) for d in self.json_data.get("Statistics") or [] )
+        ranking = self.json_data.get("Ranking") or []
+        if not ranking:
+            return ""
+        buf = []; add = buf.append
+        add('<h2>Ranking</h2>\n<table>\n')
+        add('<tr><th>name</th><th>real</th><th>ratio</th><th>median</th><th>95% CI</th></tr>\n')
+        for d in ranking:
+            st = stats.get(d['name'])
+            add('<tr><td>%s</td><td>%s</td><td>%s%%</td><td>%s</td><td>%s</td></tr>\n'
+                % (_h(d['name']), d['real'], d['ratio'],
+                   st['median'] if st else "-",
+                   "[%s, %s]" % tuple(st['ci']) if st else "-"))
+        add('</table>\n')
+        return "".join(buf)
+
+    def _axes(self, add, ymax, xlabels, ylabel="real (sec)"):
+        ## draws axes, y grid and x labels; returns function to map y value
+        W, H, M = self.WIDTH, self.HEIGHT, self.MARGIN
+        ymax = ymax or 1.0
+        def y_of(v):
+            return H - M - (v / ymax) * (H - 2 * M)
+        add('<line x1="%d" y1="%d" x2="%d" y2="%d" stroke="#444"/>\n' % (M, H - M, W - 10, H - M))
+        add('<line x1="%d" y1="%d" x2="%d" y2="%d" stroke="#444"/>\n' % (M, M - 10, M, H - M))
+        for i in xrange(5):
+            v = ymax * i / 4.0
+            y = y_of(v)
+            add('<line x1="%d" y1="%.1f" x2="%d" y2="%.1f" stroke="#ddd"/>' % (M, y, W - 10, y))
+            add('<text x="%d" y="%.1f" text-anchor="end">%s</text>\n' % (M - 4, y + 4, "%.4g" % v))
+        for x, label in xlabels:
+            add('<text x="%.1f" y="%d" text-anchor="middle">%s</text>\n' % (x, H - M + 16, _h(label)))
+        add('<text x="12" y="%d" transform="rotate(-90 12 %d)" text-anchor="middle">%s</text>\n'
+            % (H // 2, H // 2, _h(ylabel)))
+        return y_of
+
+    def _legend(self, add, names):
+        x = self.MARGIN + 10
+        for i, name in enumerate(names):
+            add('<rect x="%d" y="6" width="10" height="10" fill="%s"/>' % (x, self._color(i)))
+            add('<text x="%d" y="15">%s</text>\n' % (x + 14, _h(name)))
+            x += 24 + 7 * len(str(name))
+
+    def render_scatter(self, samples):
+        W, H, M = self.WIDTH, self.HEIGHT, self.MARGIN
+        ncycles = max( len(points) for _, points in samples )
+        ymax = max([ real for _, points in samples for _, real, _ in points ] or [0]) * 1.1
+        def x_of(cycle):
+            return M + (cycle - 0.5) / ncycles * (W - M - 10)
+        buf = []; add = buf.append
+        add('<svg width="%d" height="%d" xmlns="http://www.w3.org/2000/svg">\n' % (W, H))
+        y_of = self._axes(add, ymax, [ (x_of(c), "#%d" % c) for c in xrange(1, ncycles + 1) ])
+        for i, (name, points) in enumerate(samples):
+            for cycle, real, ignored in points:
+                ## ignored (extra min & max) cycles are drawn hollow
+                add('<circle cx="%.1f" cy="%.1f" r="4" stroke="%s" fill="%s">'
+                    '<title>%s #%d: %s</title></circle>\n'
+                    % (x_of(cycle) + (i - len(samples) / 2.0) * 3, y_of(real), self._color(i),
+                       "none" if ignored else self._color(i), _h(name), cycle, real))
+        self._legend(add, [ name for name, _ in samples ])
+        add('</svg>\n')
+        return "".join(buf)
+
+    def render_boxplot(self, samples):
+        W, H, M = self.WIDTH, self.HEIGHT, self.MARGIN
+        n = len(samples)
+        ymax = max([ real for _, points in samples for _, real, _ in points ] or [0]) * 1.1
+        def x_of(i):
+            return M + (i + 0.5) / n * (W - M - 10)
+        buf = []; add = buf.append
+        add('<svg width="%d" height="%d" xmlns="http://www.w3.org/2000/svg">\n' % (W, H))
+        y_of = self._axes(add, ymax, [ (x_of(i), name) for i, (name, _) in enumerate(samples) ])
+        half = min(20, (W - M) / n / 4.0)
+        for i, (name, points) in enumerate(samples):
+            values = sorted( real for _, real, ignored in points if not ignored )
+            if not values:
+                continue
+            lo, q1, med, q3, hi = [ _percentile(values, p) for p in (0, 25, 50, 75, 100) ]
+            x = x_of(i); color = self._color(i)
+            add('<g><title>%s: min=%s q1=%s median=%s q3=%s max=%s</title>\n'
+                % (_h(name), lo, q1, med, q3, hi))
+            add('<line x1="%.1f" y1="%.1f" x2="%.1f" y2="%.1f" stroke="%s"/>\n'
+                % (x, y_of(lo), x, y_of(hi), color))
+            add('<rect x="%.1f" y="%.1f" width="%.1f" height="%.1f" fill="%s" fill-opacity="0.4"'
+                ' stroke="%s"/>\n' % (x - half, y_of(q3), 2 * half, max(y_of(q1) - y_of(q3), 1),
+                                      color, color))
+            add('<line x1="%.1f" y1="%.1f" x2="%.1f" y2="%.1f" stroke="%s" stroke-width="2"/>\n'
+                % (x - half, y_of(med), x + half, y_of(med), color))
+            add('</g>\n')
+        add('</svg>\n')
+        return "".join(buf)
+
+    def render_heatmap(self, matrix):
+        n = len(matrix)
+        cell, left, top = 64, 12 + 7 * max( len(d['name']) for d in matrix ), 24
+        W, H = left + cell * n + 10, top + cell * n // 2 + 10
+        buf = []; add = buf.append
+        add('<svg width="%d" height="%d" xmlns="http://www.w3.org/2000/svg">\n' % (W, H))
+        for j in xrange(n):
+            add('<text x="%d" y="16" text-anchor="middle">[%02d]</text>\n'
+                % (left + cell * j + cell // 2, j + 1))
+        for i, d in enumerate(matrix):
+            y = top + i * cell // 2
+            add('<text x="%d" y="%d" text-anchor="end">[%02d] %s</text>\n'
+                % (left - 6, y + cell // 4 + 4, i + 1, _h(d['name'])))
+            for j, ratio in enumerate(d['cols']):
+                ## green if the row is faster than the column, red if slower
+                t = max(-1.0, min(1.0, math.log(max(float(ratio), 0.1) / 100.0, 10)))
+                r, g = (int(255 - 160 * t), 255) if t >= 0 else (255, int(255 + 160 * t))
+                add('<g><title>%s vs %s: %s%%</title><rect x="%d" y="%d" width="%d" height="%d"'
+                    ' fill="rgb(%d,%d,%d)" stroke="#fff"/>'
+                    '<text x="%d" y="%d" text-anchor="middle">%s</text></g>\n'
+                    % (_h(d['name']), _h(matrix[j]['name']), ratio,
+                       left + cell * j, y, cell, cell // 2, r, g, min(r, g),
+                       left + cell * j + cell // 2, y + cell // 4 + 4, ratio))
+        add('</svg>\n')
+        return "".join(buf)
+
+    def render_scaling(self, params):
+        ## real time against the last parameter, a line for each row of group
+        groups = []
+        for d in params:
+            if d['group'] not in groups:
+                groups.append(d['group'])
+        buf = []; add = buf.append
+        W, H, M = self.WIDTH, self.HEIGHT, self.MARGIN
+        for group in groups:
+            items = [ d for d in params if d['group'] == group and d['real'] is not None ]
+            if not items:
+                continue
+            col_key = sorted(items[0]['params'])[-1]
+            xs = []
+            for d in items:
+                if d['params'][col_key] not in xs:
+                    xs.append(d['params'][col_key])
+            numeric = all( isinstance(x, (int, float)) and x > 0 for x in xs )
+            log_scale = numeric and max(xs) / float(min(xs)) >= 100
+            if numeric:
+                lo, hi = min(xs), max(xs)
+                f = (lambda v: math.log(v)) if log_scale else (lambda v: float(v))
+                span = (f(hi) - f(lo)) or 1.0
+                x_of = lambda v: M + 20 + (f(v) - f(lo)) / span * (W - M - 50)
+            else:
+                x_of = lambda v: M + 20 + xs.index(v) / float(max(len(xs) - 1, 1)) * (W - M - 50)
+            labels, points_of = [], {}
+            for d in items:
+                label = ", ".join( "%s=%s" % (k, d['params'][k])
+                                   for k in sorted(d['params']) if k != col_key ) or group
+                if label not in points_of:
+                    labels.append(label)
+                    points_of[label] = []
+                points_of[label].append((d['params'][col_key], float(d['real'])))
+            lines = [ (label, points_of[label]) for label in labels ]
+            ymax = max( float(d['real']) for d in items ) * 1.1
+            add('<h2>Scaling: %s (%s%s)</h2>\n' % (_h(group), _h(col_key), ", log scale" if log_scale else ""))
+            add('<svg width="%d" height="%d" xmlns="http://www.w3.org/2000/svg">\n' % (W, H))
+            y_of = self._axes(add, ymax, [ (x_of(x), "%s" % x) for x in xs ])
+            for i, (label, points) in enumerate(lines):
+                color = self._color(i)
+                path = " ".join( "%.1f,%.1f" % (x_of(x), y_of(y)) for x, y in points )
+                add('<polyline points="%s" fill="none" stroke="%s" stroke-width="2"/>\n' % (path, color))
+                for x, y in points:
+                    add('<circle cx="%.1f" cy="%.1f" r="3" fill="%s"><title>%s %s=%s: %s</title></circle>\n'
+                        % (x_of(x), y_of(y), color, _h(label), _h(col_key), x, y))
+            self._legend(add, [ label for label, _ in lines ])
+            add('</svg>\n')
+        return "".join(buf)
+
+
+def _h(value):
+    ## escapes HTML
+    return (str(value).replace("&", "&amp;").replace("<", "&lt;")
+                      .replace(">", "&gt;").replace('"', "&quot;"))
+
+
+def _format_float(fmt, value):
+    return None if value is None else Float(fmt % value)
+
+
+def _format_bytes(size):
+    if size is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return ("%d%s" if unit == "B" else "%.1f%s") % (size, unit)
+        size /= 1024.0
+    return "%.1fGiB" % size
+
+
+_STMT_TEMPLATE = """
+def _stmt_func(_bm):
+%(setup)s
+    with _bm:
+        for _i in _bm:
+%(stmt)s
+"""
+
+
+def _compile_stmt(stmt, setup="pass", unroll=1, globals=None):
+    ## function which runs setup and then repeats stmt 'unroll' times in
+    ## each iteration; names defined in setup are local variables of it
+    import textwrap
+    def indent(src, width):
+        src = textwrap.dedent(src).strip("\n") or "pass"
+        compile(src, "<stmt>", "exec")     # raises SyntaxError
+        return "\n".join( " " * width + line for line in src.splitlines() )
+    source = _STMT_TEMPLATE % {"setup": indent(setup, 4),
+                               "stmt":  "\n".join([indent(stmt, 12)] * unroll)}
+    namespace = dict(globals or {})
+    exec(compile(source, "<stmt>", "exec"), namespace)
+    return namespace['_stmt_func']
+
+
+def _format_duration(sec):
+    for unit, scale in (("ns", 1e-9), ("us", 1e-6), ("ms", 1e-3)):
+        if sec < scale * 1000:
+            return "%.1f%s" % (sec / scale, unit)
+    return "%.3fs" % sec
+
+
+def _format_nsec(sec):
+    if sec is None:
+        return "-"
+    return "%.0fns" % (sec * 1e9)
+
+
 def _get_cpu_model():
     import platform
     system = platform.system()
@@ -591,6 +3241,291 @@ def _get_cpu_model():
     return None
 
 
+class History(object):
+    """
+    Results history in SQLite database. Each run of Benchmarker is appended
+    with environment (including git commit), samples of each cycle and
+    summary of each benchmark.
+
+    ex:
+       >>> history = History("bench.db")
+       >>> for row in history.trend("join"):
+       ...     print(row['run'], row['git_commit'], row['median'])
+    """
+
+    SCHEMA = """
+    create table if not exists runs (
+      id           integer primary key autoincrement,
+      created_at   text    not null,
+      git_commit   text,
+      environment  text    not null        -- JSON
+    );
+    create table if not exists samples (
+      run_id       integer not null references runs(id),
+      name         text    not null,
+      cycle        integer not null,
+      loop         integer,
+      real         real    not null,
+      user         real    not null,
+      sys          real    not null,
+      ignored      integer not null default 0  -- 1 if excluded as extra min/max
+    );
+    create table if not exists summaries (
+      run_id       integer not null references runs(id),
+      name         text    not null,
+      loop         integer,
+      cycles       integer not null,
+      mean         real    not null,
+      median       real    not null,
+      stddev       real    not null,
+      ci_low       real    not null,
+      ci_high      real    not null
+    );
+    create index if not exists summaries_name on summaries(name, run_id);
+    """
+
+    def __init__(self, filename):
+        try:
+            import sqlite3
+        except ImportError:
+            raise BenchmarkerError("history: sqlite3 module is not available.")
+        self.filename = filename
+        self._conn = sqlite3.connect(filename)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(self.SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def record(self, environment, benchmarks):
+        ## returns id of new run
+        import json
+        from datetime import datetime
+        conn = self._conn
+        with conn:
+            cur = conn.execute(
+                "insert into runs (created_at, git_commit, environment) values (?, ?, ?)",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), environment.get("git commit"),
+                 json.dumps(environment, ensure_ascii=False, sort_keys=True)))
+            run_id = cur.lastrowid
+            for bm in benchmarks:
+                if bm.skipped or bm.name is None:
+                    continue
+                ignored = set( cycle for cycle, _ in bm._extra_mins + bm._extra_maxs )
+                conn.executemany(
+                    "insert into samples values (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [ (run_id, bm.name, cycle, el.loop or bm.loop, el.real_time,
+                       el.user_time, el.sys_time, int(cycle in ignored))
+                      for cycle, el in enumerate(bm.results, 1) ])
+                st = bm.stats
+                conn.execute(
+                    "insert into summaries values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (run_id, bm.name, bm.loop, st.n, st.mean, st.median, st.stddev,
+                     st.ci[0], st.ci[1]))
+        return run_id
+
+    def runs(self):
+        ## list of runs (dict), oldest first
+        import json
+        rows = self._conn.execute("select * from runs order by id").fetchall()
+        return [ dict(run=r['id'], created_at=r['created_at'], git_commit=r['git_commit'],
+                      environment=json.loads(r['environment'])) for r in rows ]
+
+    def names(self):
+        rows = self._conn.execute("select name from summaries group by name"
+                                  " order by min(run_id), min(rowid)").fetchall()
+        return [ r['name'] for r in rows ]
+
+    def samples(self, run_id, name):
+        rows = self._conn.execute("select * from samples where run_id = ? and name = ?"
+                                  " order by cycle", (run_id, name)).fetchall()
+        return [ dict(r) for r in rows ]
+
+    def trend(self, name):
+        ## summaries of benchmark in each run, oldest first
+        rows = self._conn.execute(
+            "select s.*, r.created_at, r.git_commit from summaries s"
+            " join runs r on r.id = s.run_id where s.name = ? order by s.run_id",
+            (name,)).fetchall()
+        trend = []
+        for r in rows:
+            d = dict(r)
+            d['run'] = d.pop('run_id')
+            trend.append(d)
+        return trend
+
+
+def _git_commit(path=None):
+    ## commit id of git repository (or None)
+    from subprocess import Popen, PIPE
+    try:
+        p = Popen(["git", "rev-parse", "HEAD"], cwd=path, stdout=PIPE, stderr=PIPE)
+        out, _ = p.communicate()
+    except OSError:
+        return None
+    if p.returncode != 0:
+        return None
+    return out.decode('ascii').strip() or None
+
+
+def _report_history_trends(history, names=None, width=35):
+    ## text of trend (median of real time) of each benchmark
+    buf = []; add = buf.append
+    header_format = "%-" + str(width) + "s"
+    for name in names or history.names():
+        trend = history.trend(name)
+        add(header_format % ("## %s" % name))
+        add("  run  created_at           commit      median   change\n")
+        prev = None
+        for d in trend:
+            change = ("%+7.1f%%" % ((d['median'] - prev) / prev * 100.0)) if prev else "       -"
+            add(header_format % "")
+            add(" %4s  %-19s  %-8s  %8.4f %s\n" % (d['run'], d['created_at'],
+                                                   (d['git_commit'] or "-")[:8],
+                                                   d['median'], change))
+            prev = d['median']
+        if not trend:
+            add(header_format % "")
+            add(" (no results)\n")
+        add("\n")
+    return "".join(buf)
+
+
+def _history_command(args):
+    ## python -m benchmarker history bench.db [name ...]
+    if not args:
+        sys.stderr.write("Usage: python -m benchmarker history <file.db> [name ...]\n")
+        return 1
+    filename, names = args[0], args[1:]
+    if not os.path.isfile(filename):
+        sys.stderr.write("%s: not found.\n" % (filename,))
+        return 1
+    history = History(filename)
+    try:
+        width = max([35] + [ len(n) + 4 for n in names or history.names() ])
+        sys.stdout.write(_report_history_trends(history, names, width))
+    finally:
+        history.close()
+    return 0
+
+
+def _load_result_loops(filename):
+    ## dict of benchmark name to loop count in JSON file written by '-o'
+    import json
+    with open(filename) as f:
+        json_data = json.load(f)
+    return dict( (d['name'], d['loop']) for d in json_data.get("Result") or [] )
+
+
+def _significance_mark(p_value):
+    ## '**' (p < 0.01), '*' (p < 0.05) or ''
+    if p_value is None:
+        return ""
+    return "**" if p_value < 0.01 else "*" if p_value < 0.05 else ""
+
+
+def _report_compare_files(filenames, width=35):
+    ## text of before/after table (first file is baseline) and cross-run matrix
+    runs = []
+    for filename in filenames:
+        samples, loops = _load_result_file(filename), _load_result_loops(filename)
+        runs.append((filename, samples, loops))
+    base_file, base_samples, base_loops = runs[0]
+    names = []
+    for _, samples, _ in runs:
+        names.extend( n for n in samples if n not in names )
+    ## samples scaled to loop count of baseline, because loop count can differ
+    ## between runs when it is calibrated ('-n auto')
+    def scaled(run, name):
+        _, samples, loops = run
+        values = samples.get(name)
+        if not values:
+            return None
+        base_loop, loop = base_loops.get(name), loops.get(name)
+        if base_loop and loop and base_loop != loop:
+            values = [ float(x) * base_loop / loop for x in values ]
+        return values
+    header_format = "%-" + str(width) + "s"
+    buf = []; add = buf.append
+    for run in runs[1:]:
+        add("## Compare: %s -> %s (median of real, Mann-Whitney U test)\n" % (base_file, run[0]))
+        add(header_format % "##")
+        add("       old       new    delta%    ratio  p-value    verdict\n")
+        for name in names:
+            old, new = scaled(runs[0], name), scaled(run, name)
+            if not old and not new:
+                continue
+            add(header_format % name)
+            if not old or not new:
+                verdict = "new" if new else "removed"
+                add(" %9s %9s %9s %8s %8s    %s\n" % ("-", "-", "-", "-", "-", verdict))
+                continue
+            d = _compare_samples(old, new)
+            delta = "-" if d['delta'] is None else "%+.1f" % (100.0 * d['delta'])
+            ratio = "%.3f" % (d['current'] / d['base']) if d['base'] else "-"
+            p_value = "-" if d['p_value'] is None else "%.3f" % d['p_value']
+            add(" %9.4f %9.4f %9s %8s %8s %-2s %s\n" % (
+                d['base'], d['current'], delta, ratio, p_value,
+                _significance_mark(d['p_value']), d['verdict']))
+        add("\n")
+    ## cross-run matrix: ratio of speed of each run to baseline
+    add("## Matrix (ratio of speed to [01])\n")
+    for i, run in enumerate(runs, 1):
+        add("##   [%02d] %s\n" % (i, run[0]))
+    add(header_format % "##")
+    add("      real")
+    for i in xrange(1, len(runs)+1):
+        add("%8s" % ("[%02d]" % i))
+    add("\n")
+    for name in names:
+        old = scaled(runs[0], name)
+        base = _median(old) if old else None
+        add(header_format % name)
+        add(" %9s" % ("%.4f" % base if base is not None else "-"))
+        for run in runs:
+            values = scaled(run, name)
+            median = _median(values) if values else None
+            if base is None or not median:
+                add(" %7s" % "-")
+            else:
+                add(" %7.1f" % (100.0 * base / median))
+        add("\n")
+    add("\n")
+    return "".join(buf)
+
+
+def _compare_command(args):
+    ## python -m benchmarker compare old.json new.json [more.json ...]
+    if len(args) < 2:
+        sys.stderr.write("Usage: python -m benchmarker compare <old.json> <new.json> [more.json ...]\n")
+        return 1
+    for filename in args:
+        if not os.path.isfile(filename):
+            sys.stderr.write("%s: not found.\n" % (filename,))
+            return 1
+    names = set()
+    for filename in args:
+        names.update(_load_result_file(filename))
+    width = max([35] + [ len(n) + 4 for n in names ])
+    sys.stdout.write(_report_compare_files(args, width))
+    return 0
+
+
+COMMANDS = {
+    'compare': _compare_command,
+    'history': _history_command,
+}
+
+
+def _command_main(argv):
+    ## python -m benchmarker <command> [args...]
+    if len(argv) < 2 or argv[1] not in COMMANDS:
+        sys.stderr.write("Usage: python -m benchmarker <command> [args...]\n"
+                         "Commands: %s\n" % ", ".join(sorted(COMMANDS)))
+        return 1
+    return COMMANDS[argv[1]](argv[2:])
+
+
 ###
 
 
@@ -615,7 +3550,8 @@ def _main(benchmarker, argv=None):
         sys.stdout.write("\n")
         sys.exit(0)
     if 'n' in short_opts:
-        benchmarker.loop = int(short_opts['n'])
+        n = short_opts['n']
+        benchmarker.loop = n if n == 'auto' else int(n)
     if 'c' in short_opts:
         benchmarker.cycle = int(short_opts['c'])
     if 'x' in short_opts:
@@ -624,6 +3560,110 @@ def _main(benchmarker, argv=None):
         benchmarker.outfile = short_opts['o']
     if 'f' in short_opts:
         benchmarker.filter = short_opts['f']
+    if 'clock' in long_opts:
+        clock = long_opts.pop('clock')
+        if clock not in CLOCKS:
+            sys.stderr.write("--clock=%s: unknown clock (available: %s).\n"
+                             % (clock, ", ".join(sorted(CLOCKS))))
+            sys.exit(1)
+        benchmarker.clock = clock
+    if 'isolate' in long_opts:
+        isolate = long_opts.pop('isolate')
+        if isolate is True:
+            isolate = 'process'
+        if isolate not in ('process', 'cycle'):
+            sys.stderr.write("--isolate=%s: expected 'process' or 'cycle'.\n" % (isolate,))
+            sys.exit(1)
+        benchmarker.isolate = isolate
+    if 'jobs' in long_opts:
+        jobs = long_opts.pop('jobs')
+        if jobs is True or not jobs.isdigit():
+            sys.stderr.write("--jobs=%s: integer expected.\n" % (jobs,))
+            sys.exit(1)
+        benchmarker.jobs = int(jobs)
+    if 'compare' in long_opts:
+        compare = long_opts.pop('compare')
+        if compare is True or not os.path.isfile(compare):
+            sys.stderr.write("--compare=%s: file not found.\n" % (compare,))
+            sys.exit(1)
+        benchmarker.compare = compare
+    if 'memory' in long_opts:
+        long_opts.pop('memory')
+        benchmarker.memory = True
+    if 'gc' in long_opts:
+        policy = long_opts.pop('gc')
+        if policy not in _GCProbe.POLICIES:
+            sys.stderr.write("--gc=%s: expected one of %s.\n" % (policy, ", ".join(_GCProbe.POLICIES)))
+            sys.exit(1)
+        benchmarker.gc = policy
+    if 'warmup' in long_opts:
+        warmup = long_opts.pop('warmup')
+        if warmup is True:
+            warmup = '20'
+        if not warmup.isdigit():
+            sys.stderr.write("--warmup=%s: integer expected.\n" % (warmup,))
+            sys.exit(1)
+        benchmarker.warmup = int(warmup)
+    if 'profile' in long_opts:
+        profile = long_opts.pop('profile')
+        if profile is True:
+            profile = '10'
+        if not profile.isdigit() or int(profile) < 1:
+            sys.stderr.write("--profile=%s: positive integer expected.\n" % (profile,))
+            sys.exit(1)
+        benchmarker.profile = int(profile)
+    if 'flamegraph' in long_opts:
+        rate = long_opts.pop('flamegraph')
+        if rate is True:
+            rate = '1000'
+        if not rate.isdigit() or int(rate) < 1:
+            sys.stderr.write("--flamegraph=%s: positive integer expected.\n" % (rate,))
+            sys.exit(1)
+        benchmarker.flamegraph = int(rate)
+    if 'paired' in long_opts:
+        seed = long_opts.pop('paired')
+        if seed is not True and not seed.isdigit():
+            sys.stderr.write("--paired=%s: integer expected.\n" % (seed,))
+            sys.exit(1)
+        benchmarker.paired = True
+        if seed is not True:
+            benchmarker.seed = int(seed)
+    if 'html' in long_opts:
+        html = long_opts.pop('html')
+        if html is True:
+            sys.stderr.write("--html: filename required.\n")
+            sys.exit(1)
+        benchmarker.html = html
+    if 'history' in long_opts:
+        history = long_opts.pop('history')
+        if history is True:
+            sys.stderr.write("--history: filename required.\n")
+            sys.exit(1)
+        benchmarker.history = history
+    if 'counters' in long_opts:
+        long_opts.pop('counters')
+        benchmarker.counters = True
+    if 'rusage' in long_opts:
+        long_opts.pop('rusage')
+        benchmarker.rusage = True
+    if 'latency' in long_opts:
+        long_opts.pop('latency')
+        benchmarker.latency = True
+    if 'jsonl' in long_opts:
+        jsonl = long_opts.pop('jsonl')
+        if jsonl is True:
+            sys.stderr.write("--jsonl: filename required.\n")
+            sys.exit(1)
+        benchmarker.jsonl = jsonl
+    if 'concurrency' in long_opts:
+        concurrency = long_opts.pop('concurrency')
+        if concurrency is True or not concurrency.isdigit() or int(concurrency) < 1:
+            sys.stderr.write("--concurrency=%s: positive integer expected.\n" % (concurrency,))
+            sys.exit(1)
+        benchmarker.concurrency = int(concurrency)
+    if 'no-overhead' in long_opts:
+        long_opts.pop('no-overhead')
+        benchmarker.overhead = False
     benchmarker.properties = long_opts
 
 
@@ -636,11 +3676,30 @@ Usage: python %(script)s [options]
   -h             : help
   -v             : print Benchmarker version
   -n N           : loop N times in each benchmark (N=%(loop)s)
+  -n auto        : calibrate number of loop for each benchmark
   -c N           : cycle benchmarks N times (N=%(cycle)s)
   -x N           : ignore worst N results and best N results (N=%(extra)s)
   -o result.json : output file in JSON format
   -f name=...    : filter by benchmark name   (op: '==', '!=', '=~', '!~')
   -f tag=...     : filter by user-defined tag (op: '==', '!=', '=~', '!~')
+  --clock=name   : clock to measure real time (default: %(clock)s)
+  --isolate=X    : run benchmarks in forked process (X: 'process' or 'cycle')
+  --jobs=N       : run benchmarks in parallel on N processes pinned to cpus
+  --compare=file : compare with baseline result (JSON file written by '-o')
+  --memory       : measure memory usage by tracemalloc (in extra run)
+  --gc=policy    : GC in timed region (policy: 'enable', 'disable', 'freeze')
+  --warmup[=N]   : warm up until steady state, at most N runs (N=20)
+  --latency      : sample latency of iterations and report percentiles
+  --no-overhead  : don't subtract loop overhead automatically
+  --jsonl=file   : append results into file in JSON Lines format while running
+  --concurrency=N: run N tasks of async benchmark concurrently
+  --counters     : count perf events (cycles, cache misses, ...; Linux only)
+  --rusage       : report page faults, context switches and growth of max RSS
+  --profile[=N]  : profile benchmarks by cProfile and report top N functions (N=10)
+  --flamegraph[=HZ]: sample stacks at HZ and write flamegraph (HZ=1000)
+  --history=file : append results into SQLite database file
+  --html=file    : write report in HTML format with charts
+  --paired[=SEED]: shuffle order of benchmarks in each cycle and compare pairs
   --key[=value]  : user-defined properties
 
 Tips:
@@ -664,7 +3723,8 @@ Tips:
               ...
       $ python test1.py                  # ignores heavy benchmarks
       $ python test1.py -f 'tag=~.'      # runs all, including heavy ones
-"""[1:] % {'script': script, 'loop': loop, 'cycle': cycle, 'extra': extra}
+"""[1:] % {'script': script, 'loop': loop, 'cycle': cycle, 'extra': extra,
+          'clock': benchmarker.clock or DEFAULT_CLOCK}
 
 
 def _parse_cmdopts(argv=None):
@@ -698,7 +3758,9 @@ def _parse_cmdopts(argv=None):
                         if not args:
                             raise CommandOptionError("-%s: argument required." % ch)
                         optarg = args.pop(0)
-                    if ch in "ncx" and not optarg.isdigit():
+                    if ch == "n" and optarg == "auto":
+                        pass
+                    elif ch in "ncx" and not optarg.isdigit():
                         raise CommandOptionError("-%s %s: integer expected." % (ch, optarg))
                     if ch == "f" and not _parse_filter(optarg):
                         raise CommandOptionError("-%s %s: invalid argument." % (ch, optarg))
@@ -712,3 +3774,116 @@ def _parse_cmdopts(argv=None):
 
 def _parse_filter(filter_opt):
     return re.match(r'^(\w+)(=[=~]?|![=~])(.+)$', filter_opt)
+
+
+
+###
+
+
+class PytestPlugin(object):
+    """
+    pytest plugin which provides 'bench' fixture. Each benchmark runs in
+    its test, and results of all benchmarks are reported at the end of
+    session (and written into '--bench-outfile=file').
+
+    ex:
+       ## test_example.py  (run 'pytest -p benchmarker -k join')
+       def test_join(bench):
+           s1, s2 = "Haruhi", "Mikuru"
+           @bench
+           def bm(bm):
+               for _ in bm:
+                   sos = ''.join((s1, s2))
+           assert bm.average.real_time < 1.0
+    """
+
+    def __init__(self, config):
+        getoption = config.getoption
+        loop = getoption("bench_loop")
+        self.loop    = loop if loop == 'auto' else int(loop)
+        self.cycle   = getoption("bench_cycle")
+        self.extra   = getoption("bench_extra")
+        self.outfile = getoption("bench_outfile")
+        self.benchmarks = []
+
+    def bench(self, request):
+        ## fixture (decorated by pytest.fixture in pytest_configure())
+        def run(func, **tags):
+            ## node id (ex: 'test_foo.py::TestFoo::test_bar[10]') is unique
+            ## in session, while test name can be the same in other module
+            name = tags.pop('name', None) or request.node.nodeid
+            bm = Benchmark(name, self.loop, **tags)(func)
+            runner = _PytestBenchmarker(self.loop, cycle=self.cycle, extra=self.extra, argv=False)
+            runner.benchmarks.append(bm)
+            runner.run()
+            if bm.skipped:
+                import pytest
+                pytest.skip(str(bm.skipped))
+            self.benchmarks.extend(runner.benchmarks)
+            return bm
+        return run
+
+    def pytest_terminal_summary(self, terminalreporter):
+        if not self.benchmarks:
+            return
+        width = max([35] + [ len(bm.name) + 4 for bm in self.benchmarks ])
+        benchmarker = _PytestBenchmarker(self.loop, width, self.cycle, self.extra,
+                                         outfile=self.outfile, argv=False)
+        benchmarker.benchmarks = self.benchmarks
+        benchmarker._report_results()
+        terminalreporter.write_sep("=", "benchmarker")
+        terminalreporter.write("".join(benchmarker.output))
+
+
+class _PytestBenchmarker(Benchmarker):
+    ## keeps output to show it in terminal summary of pytest
+
+    def __init__(self, *args, **kwargs):
+        Benchmarker.__init__(self, *args, **kwargs)
+        self.output = []
+
+    def _write(self, msg):
+        self.output.append(msg)
+
+    def _report_results(self):
+        ## reports results of benchmarks which have already run
+        self._stream = None
+        self._setup()
+        rep = self.reporter
+        write = self._write
+        ntimes = self._ntimes()
+        write(rep.report_bench_begin())
+        for cycle in xrange(1, ntimes+1):
+            write(rep.report_bench_header(None if ntimes == 1 else cycle))
+            for bm in self.benchmarks:
+                write(rep.report_bench_name(bm.name))
+                write(rep.report_bench_elapsed(bm.results[cycle-1]))
+            write(rep.report_bench_footer())
+        write(rep.report_bench_end())
+        self._teardown()
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmarker")
+    group.addoption("--bench-loop", default="auto", metavar="N",
+                    help="number of loop of 'bench' fixture (default: auto)")
+    group.addoption("--bench-cycle", type=int, default=1, metavar="N",
+                    help="number of cycles of 'bench' fixture (default: 1)")
+    group.addoption("--bench-extra", type=int, default=0, metavar="N",
+                    help="number of extra cycles of 'bench' fixture (default: 0)")
+    group.addoption("--bench-outfile", default=None, metavar="FILE",
+                    help="write results of 'bench' fixture in JSON format")
+
+
+def pytest_configure(config):
+    import pytest     # imported here, because this module doesn't require pytest
+    loop = config.getoption("bench_loop")
+    if loop != 'auto' and not loop.isdigit():
+        raise pytest.UsageError("--bench-loop=%s: integer or 'auto' expected." % (loop,))
+    class Plugin(PytestPlugin):
+        bench = pytest.fixture(PytestPlugin.bench)
+    config.pluginmanager.register(Plugin(config), "benchmarker-fixture")
+
+
+if __name__ == '__main__':
+    sys.exit(_command_main(sys.argv))
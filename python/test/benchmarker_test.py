@@ -12,7 +12,7 @@ except LoadError:
 from oktest import ok, test, subject, situation, skip, at_end
 from oktest.dummy import dummy_file, dummy_io
 
-from benchmarker import Benchmarker, Benchmark
+from benchmarker import Benchmarker, Benchmark, DEFAULT_CLOCK
 
 
 def retrieve_sample_code_from_module_doc():
@@ -59,6 +59,7 @@ EXPECTED_OUTPUT = r"""
 ## python executable:   STRING
 ## cpu model:           STRING
 ## parameters:          loop=1000, cycle=5, extra=1
+## clock:               CLOCK (resolution=Dns, overhead=Dns)
 
 ## (#1)                   real    (total    = user    + sys)
 (Empty)                 D.DDDD    D.DDDD    D.DDDD    D.DDDD
@@ -121,6 +122,12 @@ join()                  D.DDDD    D.DDDD    D.DDDD    D.DDDD
 '%' op                  D.DDDD    D.DDDD    D.DDDD    D.DDDD
 format()                D.DDDD    D.DDDD    D.DDDD    D.DDDD
 
+## Statistics (real)    median       mad    stddev      cv%   95% CI of median
+'+' op                  D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+join()                  D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+'%' op                  D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+format()                D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+
 ## Ranking                real
 DESCRIPT                D.DDDD  (100.0) ********************
 DESCRIPT                D.DDDD  ( DD.D) BAR
@@ -133,7 +140,7 @@ DESCRIPT                D.DDDD  ( DD.D) BAR
 [03] DESCRIPT           D.DDDD    DD.D    DD.D   100.0   DDD.D
 [04] DESCRIPT           D.DDDD    DD.D    DD.D    DD.D   100.0
 
-"""[1:]
+"""[1:].replace("CLOCK", DEFAULT_CLOCK)
 
 def output2pattern(expected_output):
     expected_pattern = (
@@ -142,11 +149,28 @@ def output2pattern(expected_output):
           .replace('STRING', r'\S.*')
           .replace('BAR', r'\*{1,20}')
           .replace('DESCRIPT', r"('\+' op  |join\(\)  |'\%' op  |format\(\))")
+          .replace('Dns', r'\d+ns')
+          .replace(r'DDD\.D  \[', r' *\d+\.\d  \[')
           .replace('D', r'\d')
         #+ '$'
     )
     return expected_pattern
 
+
+def perf_available():
+    try:
+        from benchmarker import PerfCounters
+        return bool(PerfCounters.available_events())
+    except Exception:
+        return False
+
+def pytest_available():
+    try:
+        import pytest
+        return True
+    except ImportError:
+        return False
+
 EXPECTED_OUTPUT_PATTERN = output2pattern(EXPECTED_OUTPUT)
 
 EXPECTED_HELP = r"""
@@ -154,11 +178,30 @@ Usage: python %(script)s [options]
   -h             : help
   -v             : print Benchmarker version
   -n N           : loop N times in each benchmark (N=1000)
+  -n auto        : calibrate number of loop for each benchmark
   -c N           : cycle benchmarks N times (N=5)
   -x N           : ignore worst N results and best N results (N=1)
   -o result.json : output file in JSON format
   -f name=...    : filter by benchmark name   (op: '==', '!=', '=~', '!~')
   -f tag=...     : filter by user-defined tag (op: '==', '!=', '=~', '!~')
+  --clock=name   : clock to measure real time (default: %(clock)s)
+  --isolate=X    : run benchmarks in forked process (X: 'process' or 'cycle')
+  --jobs=N       : run benchmarks in parallel on N processes pinned to cpus
+  --compare=file : compare with baseline result (JSON file written by '-o')
+  --memory       : measure memory usage by tracemalloc (in extra run)
+  --gc=policy    : GC in timed region (policy: 'enable', 'disable', 'freeze')
+  --warmup[=N]   : warm up until steady state, at most N runs (N=20)
+  --latency      : sample latency of iterations and report percentiles
+  --no-overhead  : don't subtract loop overhead automatically
+  --jsonl=file   : append results into file in JSON Lines format while running
+  --concurrency=N: run N tasks of async benchmark concurrently
+  --counters     : count perf events (cycles, cache misses, ...; Linux only)
+  --rusage       : report page faults, context switches and growth of max RSS
+  --profile[=N]  : profile benchmarks by cProfile and report top N functions (N=10)
+  --flamegraph[=HZ]: sample stacks at HZ and write flamegraph (HZ=1000)
+  --history=file : append results into SQLite database file
+  --html=file    : write report in HTML format with charts
+  --paired[=SEED]: shuffle order of benchmarks in each cycle and compare pairs
   --key[=value]  : user-defined properties
 
 Tips:
@@ -219,7 +262,7 @@ class Benchmarker_TC(unittest.TestCase):
 
     @test("'-h' shows help message")
     def _(self, sample_file):
-        expected_help = EXPECTED_HELP % {'script': sample_file}
+        expected_help = EXPECTED_HELP % {'script': sample_file, 'clock': DEFAULT_CLOCK}
         sout, serr = run_command("%s %s -h" % (sys.executable, sample_file))
         ok (sout) == expected_help
         ok (serr) == ""
@@ -241,6 +284,47 @@ class Benchmarker_TC(unittest.TestCase):
         ok (sout).matches(expected_pattern)
         ok (serr) == ""
 
+    @test("'-n auto' calibrates number of loop for each benchmark")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        with open(sample_file) as f:
+            content = f.read()
+        content = content.replace("from benchmarker import Benchmarker\n",
+                                  "from benchmarker import Benchmarker, Benchmark\n"
+                                  "Benchmark.AUTO_LOOP_TIME = 0.001\n")
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s -n auto -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (sout).contains("## parameters:          loop=auto, cycle=5, extra=1\n")
+        ok (serr) == ""
+        with open(jsonfile) as f:
+            d = json.load(f)
+        ok (d['Environment']['parameters']['loop']) == "auto"
+        for item in d['Result']:
+            ok (item['loop']).is_a(int)
+            ok (item['loop'] >= 1) == True
+
+    @test("'-n auto' gives up calibration when time doesn't grow with loop count")
+    def _(self, sample_file):
+        content = r"""
+import time
+from benchmarker import Benchmarker
+with Benchmarker(width=20) as bench:
+    @bench("sleep")
+    def _(bm):
+        with bm:
+            time.sleep(0.001)      # doesn't iterate 'for _ in bm'
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s -n auto" % (sys.executable, sample_file))
+        ok (serr).matches(r"BenchmarkerError: sleep: time doesn't grow with loop count"
+                          r" \(loop=\d+, \d+\.\d+ms\); use 'for _ in bm' or specify loop count"
+                          r" instead of 'auto'\.\n$")
+
     @test("'-c' changes number of cycle")
     def _(self, sample_file):
         s = EXPECTED_OUTPUT
@@ -261,6 +345,93 @@ class Benchmarker_TC(unittest.TestCase):
         ok (sout).matches(expected_pattern)
         ok (serr) == ""
 
+    @test("'--clock=name' changes clock to measure real time")
+    def _(self, sample_file):
+        s = EXPECTED_OUTPUT
+        s = s.replace(DEFAULT_CLOCK + " (", "monotonic_ns (")
+        expected_pattern = output2pattern(s)
+        sout, serr = run_command("%s %s --clock=monotonic_ns" % (sys.executable, sample_file))
+        ok (sout).matches(expected_pattern)
+        ok (serr) == ""
+        #
+        sout, serr = run_command("%s %s --clock=foobar" % (sys.executable, sample_file))
+        ok (sout) == ""
+        ok (serr).should.startswith("--clock=foobar: unknown clock (available: ")
+
+    @test("warns when elapsed time is too short compared to clock resolution")
+    def _(self, sample_file):
+        content = r"""
+from benchmarker import Benchmarker, Clock
+Clock.WARN_TICKS = 10**9
+with Benchmarker(10, width=20, cycle=2) as bench:
+    @bench("too short")
+    def _(bm):
+        for _ in bm:
+            pass
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s" % (sys.executable, sample_file))
+        ok (sout).contains(
+            "## Warning: too short to measure (< 1000000000 ticks of %s resolution)\n"
+            "too short            (#1) (#2)\n" % DEFAULT_CLOCK)
+        ok (serr) == ""
+
+    @test("'--isolate' runs each benchmark in forked process")
+    @skip.when(not hasattr(os, 'fork'), "os.fork() not available")
+    def _(self, sample_file):
+        content = r"""
+from benchmarker import Benchmarker, Skip
+seen = []
+with Benchmarker(1000, width=20, cycle=2) as bench:
+    @bench("a")
+    def _(bm):
+        if "a" in seen:
+            raise Skip("already run")
+        seen.append("a")
+        for _ in bm:
+            pass
+    @bench("b")
+    def _(bm):
+        if seen:
+            raise Skip("not isolated")
+        for _ in bm:
+            pass
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        #
+        sout, serr = run_command("%s %s" % (sys.executable, sample_file))
+        ok (sout).contains("b                       ## not isolated\n")
+        ok (serr) == ""
+        #
+        sout, serr = run_command("%s %s --isolate" % (sys.executable, sample_file))
+        ok (sout).contains("## parameters:          loop=1000, cycle=2, extra=0, isolate=process\n")
+        ok (sout).contains("## (#2)                   real    (total    = user    + sys)\n"
+                           "a                       ## already run\n")
+        ok (sout).not_contain("## not isolated")
+        ok (serr) == ""
+        #
+        sout, serr = run_command("%s %s --isolate=cycle" % (sys.executable, sample_file))
+        ok (sout).contains("## parameters:          loop=1000, cycle=2, extra=0, isolate=cycle\n")
+        ok (sout).not_contain("## already run")
+        ok (sout).not_contain("## not isolated")
+        ok (serr) == ""
+
+    @test("'--jobs=N' runs benchmarks in parallel")
+    @skip.when(not hasattr(os, 'fork'), "os.fork() not available")
+    def _(self, sample_file):
+        s = EXPECTED_OUTPUT
+        s = re.sub(r'(## clock: .*\n)', r'\1## jobs:                1\n'
+                   r"##   cpu D:             (Empty), '+' op, join(), '%' op, format()\n", s)
+        expected_pattern = output2pattern(s).replace(r'cpu \d:', r'cpu (\d+|-):')
+        sout, serr = run_command("%s %s --jobs=1" % (sys.executable, sample_file))
+        ok (sout).matches(expected_pattern)
+        ok (serr) == ""
+        #
+        sout, serr = run_command("%s %s --jobs=foo" % (sys.executable, sample_file))
+        ok (serr) == "--jobs=foo: integer expected.\n"
+
     @test("'-o' outputs JSON string")
     @skip.when(json is None, "failed to import json module")
     def _(self, sample_file):
@@ -284,9 +455,1025 @@ class Benchmarker_TC(unittest.TestCase):
         ok (d).has_key('Result')     ; ok (d['Result']).is_a(list)
         ok (d).has_key('Ignore')     ; ok (d['Ignore']).is_a(list)
         ok (d).has_key('Average')    ; ok (d['Average']).is_a(list)
+        ok (d).has_key('Statistics') ; ok (d['Statistics']).is_a(list)
         ok (d).has_key('Ranking')    ; ok (d['Ranking']).is_a(list)
         ok (d).has_key('Matrix')     ; ok (d['Matrix']).is_a(list)
 
+    @test("Statistics calculates robust statistics of samples")
+    def _(self):
+        from benchmarker import Statistics
+        st = Statistics([3.0, 1.0, 100.0, 2.0, 4.0])
+        ok (st.n)      == 5
+        ok (st.mean)   == 22.0
+        ok (st.median) == 3.0
+        ok (st.mad)    == 1.0
+        ok (st.percentiles[25]) == 2.0
+        ok (st.percentiles[95]).in_delta(80.8, 0.000001)
+        ok (st.stddev).in_delta(43.6176, 0.0001)
+        ok (st.cv).in_delta(43.6176 / 22.0, 0.0001)
+        low, high = st.ci
+        ok (low <= st.median <= high) == True
+        ok (Statistics([3.0, 1.0, 100.0, 2.0, 4.0]).ci) == st.ci   # reproducible
+
+    @test("'--compare=file' compares results with baseline")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_baseline.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        sout, serr = run_command("%s %s -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        sout, serr = run_command("%s %s --compare=%s" % (sys.executable, sample_file, jsonfile))
+        expected = r"""
+## Compared with _baseline.json (median of real, Mann-Whitney U test)
+##                        base   current    delta%  p-value  verdict
+'+' op                  D.DDDD    D.DDDD   RESULT
+join()                  D.DDDD    D.DDDD   RESULT
+'%' op                  D.DDDD    D.DDDD   RESULT
+format()                D.DDDD    D.DDDD   RESULT
+
+"""[1:]
+        expected_pattern = escape_rexp(expected).replace('D', r'\d')\
+                             .replace('RESULT', r'.* (faster|slower|unchanged)')
+        ok (sout).matches(expected_pattern)
+        ok (serr) == ""
+        #
+        sout, serr = run_command("%s %s --compare=_notexist.json" % (sys.executable, sample_file))
+        ok (serr) == "--compare=_notexist.json: file not found.\n"
+
+    @test("'--compare=file' scales baseline when loop count differs")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_baseline.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        content = r"""
+from benchmarker import Benchmarker
+with Benchmarker(width=20, cycle=3) as bench:
+    @bench("sum")
+    def _(bm):
+        for _ in bm:
+            sum(range(1000))
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s -n 2000 -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        sout, serr = run_command("%s %s -n 4000 --compare=%s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        m = re.search(r'^sum +(\d+\.\d+) +(\d+\.\d+) +([-+]\d+\.\d) ', sout, re.M)
+        ok (m) != None
+        base, current, delta = [ float(x) for x in m.groups() ]
+        ok (abs(delta)) < 50.0      # about +100% if not scaled
+        ok (abs(base - current) / current) < 0.5
+
+    @test("_mann_whitney_u() returns U statistic and two-sided p-value")
+    def _(self):
+        from benchmarker import _mann_whitney_u
+        u, p = _mann_whitney_u([1, 2, 3, 4, 5], [6, 7, 8, 9, 10])
+        ok (u) == 0
+        ok (p).in_delta(2.0 / 252, 0.000001)      # exact
+        u, p = _mann_whitney_u([1, 3, 5, 7, 9], [2, 4, 6, 8, 10])
+        ok (u) == 10
+        ok (p > 0.5) == True
+        u, p = _mann_whitney_u([1, 1, 2, 2, 3], [3, 4, 4, 5, 5])    # with ties
+        ok (p < 0.05) == True
+
+    @test("'--memory' reports memory usage of each benchmark")
+    @skip.when(not hasattr(sys, 'getallocatedblocks'), "tracemalloc not available")
+    def _(self, sample_file):
+        content = r"""
+from benchmarker import Benchmarker
+with Benchmarker(1000, width=20, cycle=2) as bench:
+    @bench("leak")
+    def _(bm):
+        kept = []
+        for i in bm:
+            kept.append([i])
+    @bench("no leak")
+    def _(bm):
+        for i in bm:
+            x = [i]
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --memory" % (sys.executable, sample_file))
+        ok (serr) == ""
+        m = re.search(r'^## Memory +peak +retained +retained/loop\n'
+                      r'leak +(\S+) +(-?\d+) +(-?\d\.\d+)\n'
+                      r'no leak +(\S+) +(-?\d+) +(-?\d\.\d+)\n', sout, re.M)
+        ok (m) != None
+        ok (float(m.group(3)) >= 1.0) == True    # list object, its items, int, ...
+        ok (float(m.group(6))).in_delta(0.0, 0.1)
+
+    @test("'--gc=policy' controls GC in timed region and reports GC activity")
+    def _(self, sample_file):
+        content = r"""
+from benchmarker import Benchmarker
+with Benchmarker(100000, width=20, cycle=2) as bench:
+    @bench("cycles")
+    def _(bm):
+        for _ in bm:
+            a = []; a.append(a)
+    @bench("cycles (nogc)", gc="disable")
+    def _(bm):
+        for _ in bm:
+            a = []; a.append(a)
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --gc=enable" % (sys.executable, sample_file))
+        ok (serr) == ""
+        m = re.search(r'^## GC \(total\) +policy +gen0 +gen1 +gen2 +pause\n'
+                      r'cycles +enable +(\d+) +\d+ +\d+ +\d\.\d{4}\n'
+                      r'cycles \(nogc\) +disable +0 +0 +0 +0\.0000\n', sout, re.M)
+        ok (m) != None
+        ok (int(m.group(1)) > 0) == True
+        #
+        sout, serr = run_command("%s %s --gc=foo" % (sys.executable, sample_file))
+        ok (serr) == "--gc=foo: expected one of enable, disable, freeze.\n"
+
+    @test("'--gc=policy' is restored even when benchmark is skipped")
+    def _(self, sample_file):
+        content = r"""
+import gc
+from benchmarker import Benchmarker, Skip
+with Benchmarker(1000, width=20, cycle=2) as bench:
+    @bench("skipped", gc="disable")
+    def _(bm):
+        raise Skip("not available")
+print("gc.isenabled(): %s" % gc.isenabled())
+print("gc.callbacks: %s" % len(getattr(gc, 'callbacks', [])))
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s" % (sys.executable, sample_file))
+        ok (serr) == ""
+        ok (sout).contains("gc.isenabled(): True\ngc.callbacks: 0\n")
+
+    @test("'--warmup=N' warms up benchmarks until steady state")
+    def _(self, sample_file):
+        content = r"""
+import time
+from benchmarker import Benchmarker
+count = [0]
+with Benchmarker(1, width=20) as bench:
+    @bench("cold start")
+    def _(bm):
+        count[0] += 1
+        for _ in bm:
+            time.sleep(0.03 if count[0] <= 2 else 0.02)
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --warmup=8" % (sys.executable, sample_file))
+        ok (serr) == ""
+        ok (sout).contains("## parameters:          loop=1, cycle=1, extra=0, warmup=8\n")
+        m = re.search(r'^## Warmup +runs +steady +curve \(real\)\n'
+                      r'cold start +(\d+) +(yes|no)  0\.0[34]\d\d 0\.0[34]\d\d 0\.0[23]\d\d', sout, re.M)
+        ok (m) != None
+        ok (int(m.group(1)) >= 5) == True
+
+    @test("'--isolate=process' closes worker of benchmark after its last cycle")
+    @skip.when(not hasattr(os, 'fork'), "fork() is not available")
+    def _(self):
+        from benchmarker import _IsolatedRunner
+        bms = [ Benchmark("bm%s" % i, 10)(lambda bm: [ None for _ in bm ]) for i in (1, 2) ]
+        runner = _IsolatedRunner(bms, 'process')
+        try:
+            for bm in bms:
+                runner.start(bm, None)()
+            ok (len(runner._pools)) == 2
+            runner.finish(bms[0])
+            ok (len(runner._pools)) == 1
+            ok (len(bms[0].results)) == 1
+        finally:
+            runner.close()
+        ok (runner._pools) == {}
+
+    @test("'--warmup=N' warms up in each fresh worker process of '--isolate=cycle'")
+    @skip.when(not hasattr(os, 'fork'), "fork() is not available")
+    def _(self, sample_file):
+        content = r"""
+import os
+from benchmarker import Benchmarker
+with Benchmarker(1, width=20, cycle=3) as bench:
+    @bench("noop")
+    def _(bm):
+        os.write(2, ("%s\n" % os.getpid()).encode())
+        for _ in bm:
+            pass
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --isolate=cycle --warmup=3" % (sys.executable, sample_file))
+        pids = serr.splitlines()
+        counts = dict( (pid, pids.count(pid)) for pid in pids )
+        ok (len(counts)) == 3                   # a worker process per cycle
+        for pid, count in counts.items():
+            ok (count) >= 2                     # warmup runs + timed run
+
+    @test("'--latency' reports percentiles of latency per iteration")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        content = r"""
+import time
+from benchmarker import Benchmarker
+with Benchmarker(100, width=20, cycle=2) as bench:
+    @bench("tail")
+    def _(bm):
+        for i in bm:
+            time.sleep(0.005 if i % 50 == 0 else 0.0001)
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --latency -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        ok (sout).matches(r'^## Latency \(per op\) +p50 +p90 +p99 +max\n'
+                          r'tail +[\d.]+us +[\d.]+(us|ms) +[\d.]+ms +[\d.]+ms\n', re.M)
+        with open(jsonfile) as f:
+            d = json.load(f)
+        item = d['Latency'][0]
+        ok (item['name']) == "tail"
+        ok (item['ops'])  == 200
+        ok (item['p50'] < 0.005 <= item['p99'] <= item['max']) == True
+
+    @test("subtracts loop overhead automatically when no empty benchmark")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        content = r"""
+from benchmarker import Benchmarker
+with Benchmarker(10000, width=20, cycle=3) as bench:
+    @bench("noop")
+    def _(bm):
+        for _ in bm:
+            pass
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        ok (sout).matches(r'^## Loop overhead +loop +real +error  \(subtracted\)\n'
+                          r'noop +10000 +[\d.]+[mun]?s +[\d.]+[mun]?s  for _ in bm\n', re.M)
+        with open(jsonfile) as f:
+            d = json.load(f)
+        ok (d['Overhead'][0]['loop']) == 10000
+        for item in d['Result']:
+            for key in ('real', 'user', 'sys'):
+                ok (min(item[key]) >= 0.0) == True
+        ## opt-out
+        sout, serr = run_command("%s %s --no-overhead" % (sys.executable, sample_file))
+        ok (serr) == ""
+        ok (sout).not_contain("## Loop overhead")
+
+    @test("measures loop overhead in advance only for selected benchmarks")
+    @skip.when(not hasattr(os, 'fork'), "fork() is not available")
+    def _(self, sample_file):
+        content = r"""
+import os
+from benchmarker import Benchmarker, LoopOverhead
+parent = os.getpid()
+measure = LoopOverhead.measure
+def _measure(self):
+    os.write(2, ("measure: loop=%s, with=%s, parent=%s\n"
+                 % (self.loop, self.with_block, os.getpid() == parent)).encode())
+    return measure(self)
+LoopOverhead.measure = _measure
+with Benchmarker(10000, width=20, cycle=3) as bench:
+    @bench("with")
+    def _(bm):
+        with bm:
+            for _ in bm:
+                pass
+    @bench("for")
+    def _(bm):
+        for _ in bm:
+            pass
+    @bench("filtered")
+    def _(bm):
+        for _ in bm:
+            pass
+    bench.stmt("1 + 1", name="stmt")
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --isolate=cycle -f 'name!=filtered'" % (sys.executable, sample_file))
+        ok (sorted(serr.splitlines())) == [
+            "measure: loop=1000, with=True, parent=True",    # stmt (unrolled)
+            "measure: loop=10000, with=False, parent=True",  # for
+            "measure: loop=10000, with=True, parent=True",   # with
+        ]
+
+    @test("subtracts cost of sampling iterations from latency samples")
+    def _(self, sample_file):
+        content = r"""
+from benchmarker import Benchmarker, LoopOverhead, _get_clock
+clock = _get_clock(None)
+plain    = LoopOverhead.get(10000, False, clock)
+sampling = LoopOverhead.get(10000, False, clock, sampling=True)
+print("plain.latency: %r" % (plain.latency,))
+print("sampling.latency > 0: %r" % (sampling.latency > 0,))
+print("cached: %r" % (sampling is LoopOverhead.get(10000, False, clock, sampling=True),))
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s" % (sys.executable, sample_file))
+        ok (serr) == ""
+        ok (sout) == ("plain.latency: None\n"
+                      "sampling.latency > 0: True\n"
+                      "cached: True\n")
+
+    @test("'--jsonl=file' appends result of each cycle in JSON Lines format")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonlfile = "_result.jsonl"
+        @at_end
+        def _(): os.path.exists(jsonlfile) and os.unlink(jsonlfile)
+        content = r"""
+from benchmarker import Benchmarker, Skip
+with Benchmarker(10, width=20, cycle=2) as bench:
+    @bench("noop")
+    def _(bm):
+        for _ in bm:
+            pass
+    @bench("skipped")
+    def _(bm):
+        raise Skip("not available")
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --jsonl=%s" % (sys.executable, sample_file, jsonlfile))
+        ok (serr) == ""
+        with open(jsonlfile) as f:
+            records = [ json.loads(line) for line in f ]
+        ok (records[0]['type']) == "begin"
+        ok (records[0]['environment']['parameters']['cycle']) == 2
+        cycles = [ (d['cycle'], d['name']) for d in records if d['type'] == "cycle" ]
+        ok (cycles) == [(1, "noop"), (1, "skipped"), (2, "noop"), (2, "skipped")]
+        ok (records[1]['loop']) == 10
+        ok (records[2]['skipped']) == "not available"
+        sections = [ d['section'] for d in records if d['type'] == "summary" ]
+        ok ("Average" in sections and "Ranking" in sections) == True
+        ok (records[-1]['type']) == "end"
+        ## appended (not overwritten)
+        sout, serr = run_command("%s %s --jsonl=%s" % (sys.executable, sample_file, jsonlfile))
+        with open(jsonlfile) as f:
+            types = [ json.loads(line)['type'] for line in f ]
+        ok (types.count("begin")) == 2
+
+    @test("runs 'async def' benchmarks on event loop, concurrently if '--concurrency=N'")
+    @skip.when(sys.version_info < (3, 7), "asyncio.get_running_loop() is not available")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        content = r"""
+import asyncio
+from benchmarker import Benchmarker
+loops = set()
+with Benchmarker(20, width=20, cycle=2) as bench:
+    @bench("sleep")
+    async def _(bm):
+        loops.add(id(asyncio.get_running_loop()))
+        for _ in bm:
+            await asyncio.sleep(0.001)
+print("loops: %s" % len(loops))
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s" % (sys.executable, sample_file))
+        ok (serr) == ""
+        ok (sout).matches(r'^sleep +0\.0[2-9]\d\d ', re.M)
+        ok (sout).not_contain("## Concurrency")
+        ok (sout).contains("loops: 1\n")    # reused across cycles
+        #
+        sout, serr = run_command("%s %s --concurrency=5 -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        ok (sout).matches(r'^sleep +0\.0[2-9]\d\d ', re.M)   # not 5 times slower
+        ok (sout).matches(r'^## Concurrency +tasks +ops/s +p50 +p99\n'
+                          r'sleep +5 +[\d.]+ +[\d.]+ms +[\d.]+ms\n', re.M)
+        with open(jsonfile) as f:
+            d = json.load(f)
+        ok (d['Concurrency'][0]['ops']) == 100
+        ok (d['Concurrency'][0]['throughput'] > 1000.0) == True
+        #
+        sout, serr = run_command("%s %s --concurrency=0" % (sys.executable, sample_file))
+        ok (serr) == "--concurrency=0: positive integer expected.\n"
+
+    @test("ranks concurrent benchmarks by time per operation")
+    @skip.when(sys.version_info < (3, 7), "asyncio.get_running_loop() is not available")
+    def _(self, sample_file):
+        content = r"""
+import asyncio, time
+from benchmarker import Benchmarker
+with Benchmarker(20, width=20, cycle=2) as bench:
+    @bench("sync")
+    def _(bm):
+        for _ in bm:
+            time.sleep(0.001)
+    @bench("async", concurrency=5)
+    async def _(bm):
+        for _ in bm:
+            await asyncio.sleep(0.001)
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s" % (sys.executable, sample_file))
+        ok (serr) == ""
+        m = re.search(r'^## Ranking +real\n'
+                      r'async +\S+ +\(100\.0\) \*{20}\n'
+                      r'sync +\S+ +\( *(\d+\.\d)\) ', sout, re.M)
+        ok (m) != None
+        ok (float(m.group(1)) < 50.0) == True    # 5 operations in each iteration
+
+    @test("'params' generates benchmark for each combination of parameters")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        content = r"""
+from benchmarker import Benchmarker
+with Benchmarker(10, width=20) as bench:
+    @bench("sort", params={"n": [10, 100, 1000]})
+    def _(bm, n):
+        data = list(range(n, 0, -1))
+        for _ in bm:
+            sorted(data)
+    @bench("join", params={"n": [1, 2], "k": ["a", "b"]})
+    def _(bm, n, k):
+        for _ in bm:
+            k.join([k] * n)
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        ok (sout).matches(r'^sort\(n=10\) +\d\.\d{4} ', re.M)
+        ok (sout).matches(r'^join\(k=b, n=2\) +\d\.\d{4} ', re.M)
+        ok (sout).matches(r'^## sort \(real\) +n=10 +n=100 +n=1000\n'
+                          r'sort( +\d\.\d{4}){3}\n', re.M)
+        ok (sout).matches(r'^## join \(real\) +n=1 +n=2\n'
+                          r'join\(k=a\)( +\d\.\d{4}){2}\n'
+                          r'join\(k=b\)( +\d\.\d{4}){2}\n', re.M)
+        with open(jsonfile) as f:
+            d = json.load(f)
+        ok ([ x['params'] for x in d['Params'] if x['group'] == "sort" ]) == \
+            [{"n": 10}, {"n": 100}, {"n": 1000}]
+        ## filter by parameter, and override parameter values
+        sout, serr = run_command("%s %s -f n=20 --n=20,30" % (sys.executable, sample_file))
+        ok (serr) == ""
+        names = re.findall(r'^(\w+\([^)]*\)) +\d\.\d{4} +\d', sout, re.M)
+        ok (names[:3]) == ["sort(n=20)", "join(k=a, n=20)", "join(k=b, n=20)"]
+        ok (sout).not_contain("n=30)")
+        ## filter by original name
+        sout, serr = run_command("%s %s -f name==sort" % (sys.executable, sample_file))
+        ok (sout).contains("sort(n=100) ")
+        ok (sout).not_contain("join(")
+
+    @test("Complexity fits samples against complexity classes")
+    def _(self):
+        import math
+        from benchmarker import Complexity
+        sizes = [10, 100, 1000, 10000]
+        c = Complexity.fit(sizes, [ 3.0 * n * math.log(n, 2) for n in sizes ])
+        ok (c.fit) == "O(n log n)"
+        ok (c.coef).in_delta(3.0, 0.000001)
+        ok (c.rms).in_delta(0.0, 0.000001)
+        ok (Complexity.fit(sizes, [5.0, 5.1, 4.9, 5.0]).fit) == "O(1)"
+        ok (Complexity.fit(sizes, [ 2.0 * n + 1.0 for n in sizes ]).fit) == "O(n)"
+        ok (Complexity.fit(sizes, [ 0.5 * n * n for n in sizes ]).fit) == "O(n^2)"
+        ok (Complexity.fit(sizes, [ math.log(n, 2) for n in sizes ]).fit) == "O(log n)"
+
+    @test("reports complexity of parametrized benchmarks over input sizes")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        content = r"""
+from benchmarker import Benchmarker
+with Benchmarker(20, width=20) as bench:
+    @bench("quadratic", params={"n": [20, 60, 200]})
+    def _(bm, n):
+        for _ in bm:
+            [ i * j for i in range(n) for j in range(n) ]
+    @bench("few sizes", params={"n": [10, 20]})
+    def _(bm, n):
+        for _ in bm:
+            list(range(n))
+    @bench("nested", params={"n": [20, 60, 200], "step": [1]})
+    def _(bm, n, step):
+        for _ in bm:
+            [ i * j for i in range(0, n, step) for j in range(n) ]
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        ok (sout).matches(r'^## Complexity \(time/op\) +fit +coef +rms\n'
+                          r'quadratic +O\(n\^2\) +[\d.]+[mun]?s +[\d.]+%\n'
+                          r'nested\(step=1\) +O\(n\^2\) +[\d.]+[mun]?s +[\d.]+%\n\n', re.M)
+        with open(jsonfile) as f:
+            d = json.load(f)
+        ok (len(d['Complexity'])) == 2     # 'few sizes' is not fitted
+        ok (d['Complexity'][0]['param']) == "n"
+        ok (d['Complexity'][0]['time']['fit']) == "O(n^2)"
+        ## not only the last parameter in alphabetical order
+        ok (d['Complexity'][1]['name']) == "nested(step=1)"
+        ok (d['Complexity'][1]['param']) == "n"
+
+    @test("'--counters' counts perf events in timed region")
+    @skip.when(not perf_available(), "perf events are not available")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        content = r"""
+from benchmarker import Benchmarker
+with Benchmarker(1000, width=20, cycle=2) as bench:
+    @bench("sum")
+    def _(bm):
+        data = list(range(1000))
+        for _ in bm:
+            sum(data)
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --counters -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        ok (sout).matches(r'^## Perf \(per loop\)( +[-\w]+)+\nsum( +[-\w.]+)+\n\n', re.M)
+        with open(jsonfile) as f:
+            d = json.load(f)
+        per_loop = d['Counters'][0]['per_loop']
+        if 'cycles' in per_loop:      # hardware events
+            ok (per_loop).has_key('ipc')
+            ok (per_loop['instructions'] > 1000) == True
+        else:                         # software events
+            ok (per_loop['task-clock'] > 1000) == True    # nsec
+        ok (d['Counters'][0]['total']).is_a(dict)
+
+    @test("PerfCounters falls back to software events")
+    @skip.when(not perf_available(), "perf events are not available")
+    def _(self):
+        from benchmarker import PerfCounters
+        original = PerfCounters.HARDWARE_EVENTS
+        @at_end
+        def _(): PerfCounters.HARDWARE_EVENTS = original
+        PerfCounters.HARDWARE_EVENTS = (("bogus", 0, 0xffff),)
+        events = PerfCounters.available_events()
+        ok (events) == ["task-clock", "page-faults", "context-switches"]
+        pc = PerfCounters(events).open()
+        try:
+            pc.start(); sum(range(100000)); pc.stop()
+        finally:
+            pc.close()
+        ok (pc.values['task-clock'] > 0) == True
+
+    @test("'--profile' profiles benchmarks by cProfile in untimed extra run")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        pstatsfile = "_result.helper_x.pstats"
+        @at_end
+        def _():
+            for fname in (jsonfile, pstatsfile):
+                os.path.exists(fname) and os.unlink(fname)
+        content = r"""
+from benchmarker import Benchmarker
+def helper(x):
+    return x * 2
+with Benchmarker(100, width=20, cycle=3) as bench:
+    @bench("helper(x)")
+    def _(bm):
+        for i in bm:
+            helper(i)
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --profile=3 -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        ok (sout).matches(r'^## Profile \(cumulative\) +ncalls +tottime +cumtime\n'
+                          r'helper\(x\) +\(_result\.helper_x\.pstats\)\n'
+                          r' +1 +[\d.]+ +[\d.]+  \w+\.py:\d+\(_\)\n'
+                          r' +100 +[\d.]+ +[\d.]+  \w+\.py:\d+\(helper\)\n', re.M)
+        ok (pstatsfile).is_file()
+        ## only extra run is profiled (timed cycles are not)
+        import pstats
+        ncalls = dict( (func[2], v[1]) for func, v in pstats.Stats(pstatsfile).stats.items() )
+        ok (ncalls['_']) == 1
+        ok (ncalls['helper']) == 100
+        with open(jsonfile) as f:
+            d = json.load(f)
+        ok (d['Profile'][0]['path']) == pstatsfile
+        ok (len(d['Profile'][0]['functions']) <= 3) == True
+
+    @test("'--flamegraph' samples stacks and writes folded stacks and SVG")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        folded, svg = "_result.squares.folded", "_result.squares.svg"
+        @at_end
+        def _():
+            for fname in (jsonfile, folded, svg):
+                os.path.exists(fname) and os.unlink(fname)
+        content = r"""
+from benchmarker import Benchmarker
+def squares(n):
+    return [ i * i for i in range(n) ]
+with Benchmarker(200, width=20) as bench:
+    @bench("squares")
+    def _(bm):
+        for _ in bm:
+            squares(5000)
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --flamegraph=500 -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        ok (sout).matches(r'^## Flamegraph +samples +rate/s +overhead\n'
+                          r'squares +\d+ +[\d.]+ +[\d.]+%  \(_result\.squares\.svg\)\n', re.M)
+        ok (folded).is_file()
+        with open(folded) as f:
+            lines = f.read().splitlines()
+        ok (len(lines) >= 1) == True
+        for line in lines:
+            ok (line).matches(r'^_ \(\w+\.py:\d+\)(;[^;]+)* \d+$')   # starts from benchmark function
+        ok ("squares (" in "".join(lines)) == True
+        with open(svg) as f:
+            content = f.read()
+        ok (content).should.startswith('<?xml version="1.0" standalone="no"?>')
+        import xml.dom.minidom
+        xml.dom.minidom.parseString(content)   # well-formed
+        with open(jsonfile) as f:
+            d = json.load(f)
+        item = d['Flamegraph'][0]
+        ok (item['samples']) == sum( int(x.rsplit(" ", 1)[1]) for x in lines )
+        ok (0.0 <= item['overhead'] < 1.0) == True
+
+    @test("'--history=file' appends results into SQLite database")
+    def _(self, sample_file):
+        dbfile = "_history.db"
+        @at_end
+        def _(): os.path.exists(dbfile) and os.unlink(dbfile)
+        content = r"""
+from benchmarker import Benchmarker
+with Benchmarker(100, width=20, cycle=3, extra=1) as bench:
+    @bench("sum")
+    def _(bm):
+        for _ in bm:
+            sum(range(100))
+    @bench("max")
+    def _(bm):
+        for _ in bm:
+            max(range(100))
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        for _ in range(2):
+            sout, serr = run_command("%s %s --history=%s" % (sys.executable, sample_file, dbfile))
+            ok (serr) == ""
+        from benchmarker import History
+        history = History(dbfile)
+        try:
+            runs = history.runs()
+            ok ([ r['run'] for r in runs ]) == [1, 2]
+            ok (runs[0]['environment']['parameters']['cycle']) == 3
+            ok (runs[0]['environment']).has_key('git commit')
+            ok (history.names()) == ["sum", "max"]
+            trend = history.trend("sum")
+            ok ([ d['run'] for d in trend ]) == [1, 2]
+            ok (trend[0]['cycles']) == 3
+            ok (trend[0]['loop'])   == 100
+            samples = history.samples(2, "max")
+            ok ([ d['cycle'] for d in samples ]) == [1, 2, 3, 4, 5]
+            ok (sum( d['ignored'] for d in samples )) == 2    # extra min & max
+        finally:
+            history.close()
+        ## CLI
+        sout, serr = run_command("%s -m benchmarker history %s sum" % (sys.executable, dbfile))
+        ok (serr) == ""
+        ok (sout).matches(r'^## sum +run +created_at +commit +median +change\n'
+                          r' +1  \d{4}-\d\d-\d\d \d\d:\d\d:\d\d  \S+ +\d\.\d{4} +-\n'
+                          r' +2  \d{4}-\d\d-\d\d \d\d:\d\d:\d\d  \S+ +\d\.\d{4} +([-+]\d+\.\d%|-)\n\n$')
+        ok (sout).not_contain("## max")
+
+    @test("'python -m benchmarker compare' compares result files")
+    @skip.when(json is None, "failed to import json module")
+    def _(self):
+        files = ["_old.json", "_new.json"]
+        @at_end
+        def _():
+            for fname in files:
+                os.path.exists(fname) and os.unlink(fname)
+        results = [
+            [{"name": "join", "loop": 100, "real": [1.0, 1.1, 1.2, 1.0, 1.1]},
+             {"name": "sum",  "loop": 100, "real": [0.5, 0.6, 0.5, 0.6, 0.5]},
+             {"name": "max",  "loop": 100, "real": [0.3, 0.3, 0.3, 0.3, 0.3]}],
+            [{"name": "join", "loop": 100, "real": [0.5, 0.6, 0.5, 0.6, 0.5]},
+             {"name": "sum",  "loop": 200, "real": [1.0, 1.2, 1.0, 1.2, 1.0]},  # same per loop
+             {"name": "min",  "loop": 100, "real": [0.2, 0.2, 0.2, 0.2, 0.2]}],
+        ]
+        for fname, items in zip(files, results):
+            with open(fname, 'w') as f:
+                json.dump({"Result": items}, f)
+        sout, serr = run_command("%s -m benchmarker compare %s %s" % (sys.executable, files[0], files[1]))
+        ok (serr) == ""
+        expected = r"""
+## Compare: _old.json -> _new.json (median of real, Mann-Whitney U test)
+##                                        old       new    delta%    ratio  p-value    verdict
+join                                   1.1000    0.5000     -54.5    0.455    0.010 *  faster
+sum                                    0.5000    0.5000      +0.0    1.000    1.000    unchanged
+max                                         -         -         -        -        -    removed
+min                                         -         -         -        -        -    new
+
+## Matrix (ratio of speed to [01])
+##   [01] _old.json
+##   [02] _new.json
+##                                       real    [01]    [02]
+join                                   1.1000   100.0   220.0
+sum                                    0.5000   100.0   100.0
+max                                    0.3000   100.0       -
+min                                         -       -       -
+
+"""[1:]
+        ok (sout) == expected
+        ## error
+        sout, serr = run_command("%s -m benchmarker compare %s" % (sys.executable, files[0]))
+        ok (serr) == "Usage: python -m benchmarker compare <old.json> <new.json> [more.json ...]\n"
+        sout, serr = run_command("%s -m benchmarker compare %s _notexist.json" % (sys.executable, files[0]))
+        ok (serr) == "_notexist.json: not found.\n"
+
+    @test("'--rusage' reports page faults, context switches and growth of max RSS")
+    @skip.when(json is None, "failed to import json module")
+    @skip.when(sys.platform.startswith("win"), "resource module is not available")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        content = r"""
+from benchmarker import Benchmarker
+with Benchmarker(1, width=20, cycle=3, extra=1) as bench:
+    @bench("alloc")
+    def _(bm):
+        for _ in bm:
+            bytearray(64 * 1024 * 1024)    # touches fresh pages
+    @bench("sum")
+    def _(bm):
+        for _ in bm:
+            sum(range(100))
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --rusage -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        ok (sout).matches(r'\n## Rusage \(total\) +minflt +majflt +nvcsw +nivcsw +maxrss +disturbed\n'
+                          r'alloc( +\d+){4} +\+\d+(\.\d)?[KMG]?i?B +(\(#\d\)|-)\n'
+                          r'sum( +\d+){4} +\+\d+(\.\d)?[KMG]?i?B +(\(#\d\)|-)\n\n')
+        with open(jsonfile) as f:
+            d = json.load(f)
+        items = d['Rusage']
+        ok ([ x['name'] for x in items ]) == ["alloc", "sum"]
+        ok (len(items[0]['cycles'])) == 5
+        ok (sorted(items[0]['cycles'][0])) == ["majflt", "maxrss", "minflt", "nivcsw", "nvcsw"]
+        ok (items[0]['total']['minflt']) > 1000       # 64MiB = 16384 pages of 4KiB
+        ok (items[0]['total']['maxrss']) > 1024 * 1024
+        ok (items[0]['total']['minflt']) > items[1]['total']['minflt']
+        ## without '--rusage' (not recorded)
+        sout, serr = run_command("%s %s -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (sout).not_contain(" minflt ")
+        with open(jsonfile) as f:
+            ok (json.load(f)).not_contain('Rusage')
+        bm = Benchmark("sum", 10)(lambda bm: [ sum(range(10)) for _ in bm ])
+        elapsed, _ = bm.run()
+        ok (elapsed.rusage) == None
+        bm.rusage = True
+        elapsed, _ = bm.run()
+        ok (sorted(elapsed.rusage)) == ["majflt", "maxrss", "minflt", "nivcsw", "nvcsw"]
+
+    @test("'--paired=SEED' shuffles order of benchmarks and reports paired differences")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        content = r"""
+from benchmarker import Benchmarker
+with Benchmarker(1000, width=20, cycle=6, extra=1) as bench:
+    @bench(None)
+    def _(bm):
+        for _ in bm:
+            pass
+    @bench("sum")
+    def _(bm):
+        for _ in bm:
+            sum(range(100))
+    @bench("max")
+    def _(bm):
+        for _ in bm:
+            max(range(100))
+    @bench("min")
+    def _(bm):
+        for _ in bm:
+            min(range(100))
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        def orders(sout):
+            cycles = re.findall(r'^## \(#\d+\).*\n((?:\S.*\n)+)', sout, re.M)
+            return [ tuple( line.split()[0] for line in c.splitlines() ) for c in cycles ]
+        sout, serr = run_command("%s %s --paired=3 -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        ok (sout).contains("## parameters:          loop=1000, cycle=6, extra=1, paired (seed=3)\n")
+        order1 = orders(sout)
+        ok (len(order1)) == 8
+        ok (set( o[0] for o in order1 )) == set(["(Empty)"])     # empty benchmark is always first
+        ok (len(set(order1))) > 1                                # shuffled
+        ok (sout).matches(r'\n## Paired comparison with sum \(seed=3\)\n'
+                          r'## +pairs +delta% +95% CI of delta% +verdict\n'
+                          r'max +6 +[-+]\d+\.\d\d +\[[-+]\d+\.\d\d, [-+]\d+\.\d\d\] +(faster|slower|unchanged)\n'
+                          r'min +6 +[-+]\d+\.\d\d +\[[-+]\d+\.\d\d, [-+]\d+\.\d\d\] +(faster|slower|unchanged)\n\n')
+        with open(jsonfile) as f:
+            d = json.load(f)
+        ok (d['Environment']['parameters']['seed']) == 3
+        ok (d['Paired']['baseline']) == "sum"
+        ok ([ x['name'] for x in d['Paired']['items'] ]) == ["max", "min"]
+        for x in d['Paired']['items']:
+            ok (x['ci'][0]) <= x['delta']
+            ok (x['delta']) <= x['ci'][1]
+        ## same seed, same order
+        sout, serr = run_command("%s %s --paired=3" % (sys.executable, sample_file))
+        ok (orders(sout)) == order1
+        ## error
+        sout, serr = run_command("%s %s --paired=x" % (sys.executable, sample_file))
+        ok (serr) == "--paired=x: integer expected.\n"
+
+    @test("'bench.stmt()' benchmarks statement compiled into unrolled loop")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        jsonfile = "_result.json"
+        @at_end
+        def _(): os.path.exists(jsonfile) and os.unlink(jsonfile)
+        content = r"""
+from benchmarker import Benchmarker, BenchmarkerError
+xs = []
+with Benchmarker(1000, width=20, cycle=2) as bench:
+    bench.stmt("s1 + s2", setup="s1, s2 = 'Haruhi', 'Mikuru'")
+    bench.stmt('''
+        xs.append(1)
+        xs.append(2)
+    ''', name="append", unroll=7, globals={"xs": xs})
+print("len(xs)=%s" % len(xs))
+try:
+    bench.stmt("x +", name="error")
+except SyntaxError:
+    print("SyntaxError")
+try:
+    bench.stmt("x", unroll=0)
+except BenchmarkerError as ex:
+    print(ex)
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s -o %s" % (sys.executable, sample_file, jsonfile))
+        ok (serr) == ""
+        ok (sout).matches(r'\n## Time per statement +unroll +loop +real\n'
+                          r's1 \+ s2 +10 +1000 +\d+\.\dns\n'
+                          r'append +7 +1001 +\d+\.\dns\n\n')
+        ok (sout).contains("len(xs)=%s\n" % (2 * 1001 * 2))    # cycle * loop * stmts
+        ok (sout).contains("SyntaxError\n")
+        ok (sout).contains("unroll=0: positive integer expected.\n")
+        with open(jsonfile) as f:
+            d = json.load(f)
+        item = d['Statement'][0]
+        ok (item['stmt'])   == "s1 + s2"
+        ok (item['unroll']) == 10
+        ok (item['loop'])   == 1000
+        ok (item['real'] > 0) == True
+        ## loop overhead is measured for iterations of unrolled loop
+        ok ([ (x['loop'], x['with']) for x in d['Overhead'] ]) == [(100, True), (143, True)]
+
+    @test("pytest plugin provides 'bench' fixture")
+    @skip.when(not pytest_available(), "pytest is not installed")
+    def _(self):
+        testfile, jsonfile = "_bench_fixture_test.py", "_result.json"
+        @at_end
+        def _():
+            for fname in (testfile, jsonfile):
+                os.path.exists(fname) and os.unlink(fname)
+        content = r"""
+import pytest
+from benchmarker import Skip
+
+def test_sum(bench):
+    @bench
+    def bm(bm):
+        for _ in bm:
+            sum(range(100))
+    assert bm.loop == 100
+    assert len(bm.results) == 5
+
+@pytest.mark.parametrize("n", [10, 100])
+def test_max(bench, n):
+    bench(lambda bm: [ max(range(n)) for _ in bm ])
+
+class TestSum(object):
+    def test_sum(self, bench):
+        bench(lambda bm: [ sum(range(10)) for _ in bm ])
+
+def test_skipped(bench):
+    def f(bm):
+        raise Skip("not available")
+    bench(f)
+"""[1:]
+        with open(testfile, 'w') as f:
+            f.write(content)
+        command = ("%s -m pytest -q -p benchmarker -p no:cacheprovider %s"
+                   " --bench-loop=100 --bench-cycle=3 --bench-extra=1 --bench-outfile=%s")
+        sout, serr = run_command(command % (sys.executable, testfile, jsonfile))
+        ok (sout).contains("## parameters:          loop=100, cycle=3, extra=1\n")
+        ok (sout).matches(r'\n## \(#5\) +real +\(total += user +\+ sys\)\n'
+                          r'\S*_bench_fixture_test\.py::test_sum +\d+\.\d{4} .*\n'
+                          r'\S*_bench_fixture_test\.py::test_max\[10\] +\d+\.\d{4} .*\n'
+                          r'\S*_bench_fixture_test\.py::test_max\[100\] +\d+\.\d{4} .*\n'
+                          r'\S*_bench_fixture_test\.py::TestSum::test_sum +\d+\.\d{4} .*\n')
+        ok (sout).contains("## Ranking")
+        ok (sout).matches(r'4 passed, 1 skipped')
+        with open(jsonfile) as f:
+            d = json.load(f)
+        ## node id is relative to rootdir of pytest
+        ok ([ x['name'].split('/')[-1] for x in d['Result'] ]) == [
+            "_bench_fixture_test.py::test_sum",
+            "_bench_fixture_test.py::test_max[10]",
+            "_bench_fixture_test.py::test_max[100]",
+            "_bench_fixture_test.py::TestSum::test_sum",
+        ]
+        ## '-k' selects benchmarks
+        sout, serr = run_command("%s -m pytest -q -p benchmarker -p no:cacheprovider %s -k test_max"
+                                 % (sys.executable, testfile))
+        ok (sout).matches(r'^\S*_bench_fixture_test\.py::test_max\[10\] +\d+\.\d{4} ', re.M)
+        ok (sout).not_contain("::test_sum")
+        ## error
+        sout, serr = run_command("%s -m pytest -q -p benchmarker -p no:cacheprovider %s --bench-loop=x"
+                                 % (sys.executable, testfile))
+        ok (serr).contains("--bench-loop=x: integer or 'auto' expected.")
+
+    @test("'--html=file' writes report in HTML with inline SVG charts")
+    @skip.when(json is None, "failed to import json module")
+    def _(self, sample_file):
+        htmlfile, jsonfile = "_result.html", "_result.json"
+        @at_end
+        def _():
+            for fname in (htmlfile, jsonfile):
+                os.path.exists(fname) and os.unlink(fname)
+        content = r"""
+from benchmarker import Benchmarker
+with Benchmarker(100, width=20, cycle=3, extra=1) as bench:
+    @bench("sort", params={"n": [10, 100, 1000]})
+    def _(bm, n):
+        data = list(range(n, 0, -1))
+        for _ in bm:
+            sorted(data)
+    @bench("<max>")
+    def _(bm):
+        for _ in bm:
+            max(range(100))
+"""[1:]
+        with open(sample_file, 'w') as f:
+            f.write(content)
+        sout, serr = run_command("%s %s --html=%s -o %s" % (sys.executable, sample_file, htmlfile, jsonfile))
+        ok (serr) == ""
+        with open(htmlfile) as f:
+            html = f.read()
+        ok (html).should.startswith("<!DOCTYPE html>")
+        ok (html).contains("<h2>Real time of each cycle</h2>")
+        ok (html).contains("<h2>Distribution of real time</h2>")
+        ok (html).contains("<h2>Matrix (ratio of speed)</h2>")
+        ok (html).contains("<h2>Scaling: sort (n, log scale)</h2>")
+        ok (html).contains("&lt;max&gt;")       # escaped
+        ok (html).not_contain("<max>")
+        ok (html).not_contain("<script")        # works offline
+        import xml.dom.minidom
+        svgs = re.findall(r'<svg.*?</svg>', html, re.S)
+        ok (len(svgs)) == 4
+        for svg in svgs:
+            xml.dom.minidom.parseString(svg)   # well-formed
+        ok (len(re.findall(r'<circle ', svgs[0]))) == 4 * 5   # scatter: benchmarks * cycles
+        ok (len(re.findall(r'fill="none"', svgs[0]))) == 4 * 2  # extra min & max
+        ## can be rendered from JSON file
+        from benchmarker import HtmlReporter
+        with open(jsonfile) as f:
+            html2 = HtmlReporter(json.load(f)).render()
+        ok (len(re.findall(r'<svg', html2))) == 4
+
     @test("'-f name=xxx' selects benchmarks by name")
     def _(self, sample_file):
         s = EXPECTED_OUTPUT
@@ -299,6 +1486,9 @@ join()                  D.DDDD      (#D)    D.DDDD      (#D)
 ## Average of 5 (=7-2*1)  real    (total    = user    + sys)
 join()                  D.DDDD    D.DDDD    D.DDDD    D.DDDD
 
+## Statistics (real)    median       mad    stddev      cv%   95% CI of median
+join()                  D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+
 ## Ranking                real
 join()                  D.DDDD  (100.0) ********************
 
@@ -337,6 +1527,11 @@ DESCRIPT                D.DDDD    D.DDDD    D.DDDD    D.DDDD
 DESCRIPT                D.DDDD    D.DDDD    D.DDDD    D.DDDD
 DESCRIPT                D.DDDD    D.DDDD    D.DDDD    D.DDDD
 
+## Statistics (real)    median       mad    stddev      cv%   95% CI of median
+DESCRIPT                D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+DESCRIPT                D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+DESCRIPT                D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+
 ## Ranking                real
 DESCRIPT                D.DDDD  (100.0) ********************
 DESCRIPT                D.DDDD  ( DD.D) BAR
@@ -374,6 +1569,10 @@ DESCRIPT                D.DDDD      (#D)    D.DDDD      (#D)
 DESCRIPT                D.DDDD    D.DDDD    D.DDDD    D.DDDD
 DESCRIPT                D.DDDD    D.DDDD    D.DDDD    D.DDDD
 
+## Statistics (real)    median       mad    stddev      cv%   95% CI of median
+DESCRIPT                D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+DESCRIPT                D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+
 ## Ranking                real
 DESCRIPT                D.DDDD  (100.0) ********************
 DESCRIPT                D.DDDD  ( DD.D) BAR
@@ -407,6 +1606,9 @@ join()                  D.DDDD      (#D)    D.DDDD      (#D)
 ## Average of 5 (=7-2*1)  real    (total    = user    + sys)
 join()                  D.DDDD    D.DDDD    D.DDDD    D.DDDD
 
+## Statistics (real)    median       mad    stddev      cv%   95% CI of median
+join()                  D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+
 ## Ranking                real
 join()                  D.DDDD  (100.0) ********************
 
@@ -444,6 +1646,10 @@ format()                D.DDDD      (#D)    D.DDDD      (#D)
 join()                  D.DDDD    D.DDDD    D.DDDD    D.DDDD
 format()                D.DDDD    D.DDDD    D.DDDD    D.DDDD
 
+## Statistics (real)    median       mad    stddev      cv%   95% CI of median
+join()                  D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+format()                D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+
 ## Ranking                real
 DESCRIPT                D.DDDD  (100.0) ********************
 DESCRIPT                D.DDDD  ( DD.D) BAR
@@ -477,6 +1683,11 @@ format()                D.DDDD      (#D)    D.DDDD      (#D)
 '%' op                  D.DDDD    D.DDDD    D.DDDD    D.DDDD
 format()                D.DDDD    D.DDDD    D.DDDD    D.DDDD
 
+## Statistics (real)    median       mad    stddev      cv%   95% CI of median
+'+' op                  D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+'%' op                  D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+format()                D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+
 ## Ranking                real
 DESCRIPT                D.DDDD  (100.0) ********************
 DESCRIPT                D.DDDD  ( DD.D) BAR
@@ -521,6 +1732,10 @@ DESCRIPT                D.DDDD  ( DD.D) BAR
 '+' op                  D.DDDD    D.DDDD    D.DDDD    D.DDDD
 '%' op                  D.DDDD    D.DDDD    D.DDDD    D.DDDD
 
+## Statistics (real)    median       mad    stddev      cv%   95% CI of median
+'+' op                  D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+'%' op                  D.DDDD    D.DDDD    D.DDDD    DDD.D  [D.DDDD, D.DDDD]
+
 ## Ranking                real
 DESCRIPT                D.DDDD  (100.0) ********************
 DESCRIPT                D.DDDD  ( DD.D) BAR